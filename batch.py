@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from typing import Iterator, Optional
+
+from loguru import logger
+
+from client import MCPClient, QueryStats
+
+# 批量运行配置
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # 同时进行的对话数
+
+# 输入记录中可作为 id / 查询文本的字段（按优先级）
+ID_FIELDS = ("id", "request_id")
+QUERY_FIELDS = ("query", "prompt", "body")
+
+# 每次查询使用独立的会话编号（即使输入中的 id 重复也不会共用对话历史）
+_session_numbers = itertools.count(1)
+
+
+def iter_queries(input_path: str) -> Iterator[tuple]:
+    """逐行读取 JSONL 输入，产出 (id, 查询文本)，不会一次性载入整个文件
+
+    id 重复时，后出现的记录改用 "<id>@line-<行号>"，续跑按这个唯一 id 判断是否已完成。
+    """
+    seen = set()
+    with open(input_path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"跳过第 {line_no} 行: JSON 解析失败 {e}")
+                continue
+
+            query_id = next((str(record[k]) for k in ID_FIELDS if record.get(k)), f"line-{line_no}")
+            query = next((record[k] for k in QUERY_FIELDS if record.get(k)), None)
+            if not query:
+                logger.warning(f"跳过第 {line_no} 行: 没有查询文本")
+                continue
+            if query_id in seen:
+                unique_id = f"{query_id}@line-{line_no}"
+                logger.warning(f"第 {line_no} 行的 id {query_id} 重复，改用 {unique_id}")
+                query_id = unique_id
+            seen.add(query_id)
+            yield query_id, query
+
+
+def load_done_ids(output_path: str) -> set:
+    """读取已有输出，返回已成功完成的 id（出错的查询会在续跑时重试）"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 崩溃时可能留下半行，忽略即可
+                continue
+            if not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+class ResultWriter:
+    """逐条追加写入结果，每条写完立即落盘，保证崩溃后可续跑"""
+
+    def __init__(self, output_path: str):
+        self._file = open(output_path, "a+b")
+        # 上次崩溃留下的半行需要先换行，避免与新记录粘连
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() > 0:
+            self._file.seek(-1, os.SEEK_END)
+            if self._file.read(1) != b"\n":
+                self._file.write(b"\n")
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def run_query(client: MCPClient, query_id: str, query: str) -> dict:
+    """执行单条查询并返回结果记录（独立会话，不共享历史）"""
+    session_id = f"batch-{next(_session_numbers)}"
+    stats = QueryStats()
+    first_token_ms: Optional[float] = None
+    error = None
+
+    started = time.perf_counter()
+    try:
+        async for _ in client.query_stream(query, session_id, stats):
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started) * 1000
+    except Exception as e:
+        logger.error(f"查询 {query_id} 失败: {e}")
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        client.reset_conversation(session_id)
+
+    return {
+        "id": query_id,
+        "query": query,
+        "response": stats.answer,  # 最终回答，不含调用工具前的中间文本
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+        "llm_calls": stats.llm_calls,
+        "tool_calls": stats.tool_calls,
+        "error": error,
+    }
+
+
+async def run_batch(
+    client: MCPClient, input_path: str, output_path: str, concurrency: int = BATCH_CONCURRENCY
+) -> dict:
+    """并发执行 input_path 中的查询，结果逐条写入 output_path，已完成的查询会被跳过
+
+    返回汇总信息: 完成数、出错数、跳过数与总耗时。
+    """
+    done_ids = load_done_ids(output_path)
+    if done_ids:
+        logger.info(f"续跑: 跳过 {len(done_ids)} 条已完成的查询")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    writer = ResultWriter(output_path)
+    summary = {"completed": 0, "errors": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    async def produce():
+        for query_id, query in iter_queries(input_path):
+            if query_id in done_ids:
+                summary["skipped"] += 1
+                continue
+            await queue.put((query_id, query))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await run_query(client, *item)
+            writer.write(record)
+            summary["completed"] += 1
+            if record["error"]:
+                summary["errors"] += 1
+            logger.info(
+                f"[{summary['completed']}] {record['id']} 完成，耗时 {record['latency_ms']:.0f} ms，"
+                f"工具调用 {record['tool_calls']} 次"
+            )
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+    summary["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return summary
@@ -0,0 +1,59 @@
+"""连接耗时基准测试：对比冷启动服务器与从预热连接池取用的 connect 到就绪耗时
+
+用法:
+    python -m bench.connect_bench [服务器脚本] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("DS_API_KEY", "bench")
+os.environ.setdefault("DS_API_BASE", "http://127.0.0.1:9")
+os.environ.setdefault("API_MODEL_NAME", "bench")
+
+from client import MCPClient  # noqa: E402
+from connections import ServerPool  # noqa: E402
+
+
+async def connect_once(server: str, pool=None) -> float:
+    """连接一次并返回 connect 到就绪的耗时（毫秒）"""
+    client = MCPClient(pool=pool)
+    try:
+        started = time.perf_counter()
+        await client.connect(server)
+        return (time.perf_counter() - started) * 1000
+    finally:
+        await client.cleanup()
+
+
+def report(label: str, timings: list) -> None:
+    print(
+        f"{label:<10}平均 {statistics.mean(timings):8.1f} ms  "
+        f"中位数 {statistics.median(timings):8.1f} ms  最大 {max(timings):8.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="MCP 服务器连接耗时基准测试")
+    parser.add_argument("server", nargs="?", default="tools.py", help="服务器脚本路径")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式的连接次数")
+    args = parser.parse_args()
+
+    cold = [await connect_once(args.server) for _ in range(args.repeat)]
+
+    pool = ServerPool(size=1)
+    try:
+        await pool.prewarm(args.server)
+        pooled = [await connect_once(args.server, pool) for _ in range(args.repeat)]
+    finally:
+        await pool.aclose()
+
+    print(f"服务器: {args.server}，每种方式 {args.repeat} 次")
+    report("冷启动", cold)
+    report("连接池", pooled)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""正文提取基准测试：对比各提取后端在一批保存的网页上的耗时与峰值内存
+
+用法:
+    python -m bench.extract_bench [页面目录] [--limit 2000] [--repeat 5]
+
+页面目录下的 *.html 文件作为语料（可以用浏览器“另存为”或 curl 保存）；
+目录不存在或为空时自动生成一批合成页面。
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+import extract
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "pages")
+
+
+def synthetic_pages(count: int = 20, seed: int = 0) -> list:
+    """生成包含导航、脚本和大段正文的合成页面"""
+    rng = random.Random(seed)
+    words = ["数据", "网络", "模型", "python", "asyncio", "缓存", "服务器", "请求", "latency", "token"]
+    pages = []
+    for i in range(count):
+        nav = "".join(f'<li><a href="/p{j}">导航 {j}</a></li>' for j in range(200))
+        script = "<script>" + "var x=1;" * rng.randint(1000, 20000) + "</script>"
+        paragraphs = "".join(
+            "<p>" + " ".join(rng.choice(words) for _ in range(rng.randint(50, 200))) + "</p>"
+            for _ in range(rng.randint(50, 2000))
+        )
+        pages.append((
+            f"synthetic-{i}.html",
+            f"<html><head><title>页面 {i}</title><style>p{{}}</style>{script}</head>"
+            f"<body><ul>{nav}</ul><article>{paragraphs}</article></body></html>",
+        ))
+    return pages
+
+
+def load_corpus(directory: str) -> list:
+    """读取目录下保存的网页"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.htm*"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def available_backends() -> list:
+    backends = ["bs4", "stream"]
+    try:
+        import selectolax  # noqa: F401
+        backends.append("selectolax")
+    except ImportError:
+        pass
+    return backends
+
+
+def measure(backend: str, html: str, limit: int, repeat: int) -> tuple:
+    """返回 (平均耗时毫秒, 峰值内存 KiB)"""
+    func = extract.BACKENDS[backend]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func(html, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.mean(timings), peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正文提取后端基准测试")
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS, help="保存网页的目录")
+    parser.add_argument("--limit", type=int, default=2000, help="提取的最大字符数")
+    parser.add_argument("--repeat", type=int, default=5, help="每个页面的计时次数")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus) if os.path.isdir(args.corpus) else []
+    if not pages:
+        print(f"未在 {args.corpus} 找到网页，使用合成页面")
+        pages = synthetic_pages()
+
+    total_kib = sum(len(html.encode("utf-8")) for _, html in pages) / 1024
+    print(f"语料: {len(pages)} 个页面，共 {total_kib:.0f} KiB，提取上限 {args.limit} 字符\n")
+    print(f"{'后端':<12}{'总耗时(ms)':>14}{'平均(ms/页)':>14}{'平均峰值(KiB)':>16}{'最大峰值(KiB)':>16}")
+
+    for backend in available_backends():
+        results = [measure(backend, html, args.limit, args.repeat) for _, html in pages]
+        times = [t for t, _ in results]
+        peaks = [p for _, p in results]
+        print(
+            f"{backend:<12}{sum(times):>14.1f}{statistics.mean(times):>14.2f}"
+            f"{statistics.mean(peaks):>16.0f}{max(peaks):>16.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""本地 OpenAI 兼容的假对话API，用于离线基准测试
+
+按脚本产出工具调用：每轮用户提问先调用 search_engine，随后对搜索结果中的网址发起
+--fanout 个并行的 search_url，共 --tool-rounds 轮，最后流式输出 --answer-tokens 个
+token 的回答。
+支持 stream 与非 stream 两种模式，并返回 usage 字段。
+
+用法:
+    python -m bench.fake_llm --port 8001 --web-base http://127.0.0.1:8002 \
+        --latency 0.2 --token-delay 0.005 --tool-rounds 2 --fanout 3
+"""
+import argparse
+import json
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: argparse.Namespace = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # 健康检查
+        self._send_json({"status": "ok"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        messages = body.get("messages", [])
+        message = self._script(messages, bool(body.get("tools")))
+        prompt_tokens = sum(len(json.dumps(m, ensure_ascii=False)) // 4 for m in messages)
+        completion_tokens = max(len((message.get("content") or "").split()), 1)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        time.sleep(self.config.latency)
+        if body.get("stream"):
+            self._stream(message, usage, body.get("stream_options", {}).get("include_usage"))
+        else:
+            time.sleep(self.config.token_delay * completion_tokens)
+            self._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _script(self, messages: list, tools_enabled: bool) -> dict:
+        """根据当前轮次已发生的工具调用轮数决定下一步"""
+        last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=0)
+        question = messages[last_user]["content"] if messages else ""
+        rounds = sum(1 for m in messages[last_user:] if m["role"] == "assistant" and m.get("tool_calls"))
+
+        if tools_enabled and rounds < self.config.tool_rounds:
+            if rounds == 0:
+                calls = [("search_engine", {"query": question[:50]})]
+            else:
+                # 优先读取本轮搜索结果中的网址，和真实模型的行为一致
+                found = []
+                for m in messages[last_user:]:
+                    if m["role"] == "tool":
+                        found.extend(re.findall(r"https?://[^\s'\"\\]+/page/\d+", m.get("content") or ""))
+                found = list(dict.fromkeys(found)) or [
+                    f"{self.config.web_base}/page/{i}" for i in range(50)
+                ]
+                calls = [
+                    ("search_url", {
+                        "url": found[((rounds - 1) * self.config.fanout + i) % len(found)],
+                        "query": question[:50],
+                    })
+                    for i in range(self.config.fanout)
+                ]
+            return {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+                    }
+                    for name, args in calls
+                ],
+            }
+
+        words = " ".join(f"word{i}" for i in range(self.config.answer_tokens))
+        return {"role": "assistant", "content": f"answer: {words}"}
+
+    def _send_json(self, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, payload: dict):
+        data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, message: dict, usage: dict, include_usage: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for index, call in enumerate(message.get("tool_calls") or []):
+            arguments = call["function"]["arguments"]
+            middle = len(arguments) // 2
+            # 参数分两段发送，模拟增量到达
+            for part, first in ((arguments[:middle], True), (arguments[middle:], False)):
+                delta = {"index": index, "function": {"arguments": part}}
+                if first:
+                    delta.update(id=call["id"], type="function")
+                    delta["function"]["name"] = call["function"]["name"]
+                self._write_chunk({"id": chunk_id, "choices": [{"index": 0, "delta": {"tool_calls": [delta]}}]})
+
+        for word in (message.get("content") or "").split(" "):
+            if not word:
+                continue
+            time.sleep(self.config.token_delay)
+            self._write_chunk({"id": chunk_id, "choices": [{"index": 0, "delta": {"content": word + " "}}]})
+
+        finish = "tool_calls" if message.get("tool_calls") else "stop"
+        self._write_chunk({"id": chunk_id, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]})
+        if include_usage:
+            self._write_chunk({"id": chunk_id, "choices": [], "usage": usage})
+        data = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假对话API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--web-base", default="http://127.0.0.1:8002", help="假网站地址")
+    parser.add_argument("--latency", type=float, default=0.2, help="首 token 延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="每个 token 的间隔（秒）")
+    parser.add_argument("--tool-rounds", type=int, default=2, help="每轮提问的工具调用轮数")
+    parser.add_argument("--fanout", type=int, default=3, help="每轮 search_url 的并行调用数")
+    parser.add_argument("--answer-tokens", type=int, default=50, help="最终回答的 token 数")
+    args = parser.parse_args()
+
+    FakeLLMHandler.config = args
+    server = ThreadingHTTPServer((args.host, args.port), FakeLLMHandler)
+    server.daemon_threads = True
+    print(f"fake LLM listening on http://{args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
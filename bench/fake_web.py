@@ -0,0 +1,106 @@
+"""本地假网站，供 search_engine / search_url 在离线基准测试中访问
+
+    /search?q=...   返回 Bing 结构的结果页（li.b_algo）
+    /page/<n>       返回约 --page-kb KB 的文章页，带 ETag 与 Last-Modified
+
+用法:
+    python -m bench.fake_web --port 8002 --latency 0.05 --page-kb 200
+"""
+import argparse
+import hashlib
+import html
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+WORDS = ["python", "asyncio", "缓存", "网络", "延迟", "模型", "工具", "服务器", "benchmark", "token"]
+
+
+def make_page(n: int, size_kb: int) -> bytes:
+    """生成第 n 个页面：导航、脚本和正文段落"""
+    rng = random.Random(n)
+    nav = "".join(f'<li><a href="/page/{i}">导航 {i}</a></li>' for i in range(100))
+    parts = [f"<html><head><title>页面 {n}</title><script>var a = {n};</script></head><body><ul>{nav}</ul>"]
+    size = sum(len(p) for p in parts)
+    while size < size_kb * 1024:
+        paragraph = "<p>" + " ".join(rng.choice(WORDS) for _ in range(80)) + "</p>"
+        parts.append(paragraph)
+        size += len(paragraph)
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+class FakeWebHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: argparse.Namespace = None
+    pages: dict = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        time.sleep(self.config.latency)
+        if url.path == "/search":
+            query = parse_qs(url.query).get("q", [""])[0]
+            self._search(query)
+        elif url.path.startswith("/page/"):
+            self._page(int(url.path.rsplit("/", 1)[-1] or 0))
+        else:
+            self._send(200, b"ok", "text/plain")
+
+    def _search(self, query: str):
+        base = f"http://{self.headers.get('Host')}"
+        seed = int(hashlib.md5(query.encode("utf-8")).hexdigest(), 16)
+        items = "".join(
+            f'<li class="b_algo"><h2><a href="{base}/page/{(seed + i) % 50}">'
+            f"{html.escape(query)} 结果 {i}</a></h2><p>摘要 {i}</p></li>"
+            for i in range(5)
+        )
+        body = f"<html><body><ol id='b_results'>{items}</ol></body></html>".encode("utf-8")
+        self._send(200, body, "text/html; charset=utf-8")
+
+    def _page(self, n: int):
+        if n not in self.pages:
+            self.pages[n] = make_page(n, self.config.page_kb)
+        body = self.pages[n]
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", None, {"ETag": etag})
+            return
+        self._send(200, body, "text/html; charset=utf-8", {
+            "ETag": etag,
+            "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+            "Cache-Control": f"max-age={self.config.max_age}",
+        })
+
+    def _send(self, status: int, body: bytes, content_type, headers: dict = None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假网站")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的延迟（秒）")
+    parser.add_argument("--page-kb", type=int, default=200, help="文章页大小（KB）")
+    parser.add_argument("--max-age", type=int, default=0, help="文章页 Cache-Control max-age（秒）")
+    args = parser.parse_args()
+
+    FakeWebHandler.config = args
+    server = ThreadingHTTPServer((args.host, args.port), FakeWebHandler)
+    server.daemon_threads = True
+    print(f"fake web listening on http://{args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
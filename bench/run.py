@@ -0,0 +1,225 @@
+"""离线端到端基准测试
+
+启动本地假对话API（bench.fake_llm）和假网站（bench.fake_web），让真实的
+MCPClient + tools.py 在不同并发度下跑完一批查询，报告每轮查询延迟的
+p50/p95/p99、首 token 延迟、吞吐量，以及客户端进程和 tools.py 服务器进程各自的内存峰值。
+
+用法:
+    python -m bench.run --queries 40 --concurrency 1,4,16 --json bench_results.json 2> bench.log
+
+结果表格输出到标准输出，服务器日志输出到标准错误。
+
+假服务的行为（延迟、工具调用轮数、并行度、页面大小）可以通过参数调整，
+见 python -m bench.run --help。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+# 在导入 loguru / client 之前降低日志级别，避免日志输出干扰计时
+os.environ.setdefault("LOGURU_LEVEL", "WARNING")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(module: str, *args: str) -> subprocess.Popen:
+    """以子进程启动假服务，等待其开始监听"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", module, *args], cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if "listening" not in line:
+        process.kill()
+        raise RuntimeError(f"{module} 启动失败: {line}")
+    return process
+
+
+def percentile(values: list, p: float) -> float:
+    """最近秩法百分位数"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def rss_mb(pid: str = "self") -> Optional[float]:
+    """进程常驻内存（MB）；读不到其他进程的 /proc 时返回 None"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        if pid != "self":
+            return None
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def server_pids() -> list:
+    """本进程启动的 tools.py 服务器子进程（通过 /proc 查找，不支持时返回空列表）"""
+    parent = str(os.getpid())
+    pids = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        # 进程名可能含空格，父进程号是右括号之后的第二个字段
+        if stat[stat.rfind(")") + 2:].split()[1] == parent and b"tools.py" in cmdline:
+            pids.append(entry)
+    return pids
+
+
+async def sample_peak_rss(peak: dict, interval: float = 0.05) -> None:
+    """采样客户端与服务器进程的内存峰值（服务器进程号在连接后写入 peak["server_pids"]）"""
+    while True:
+        peak["rss_mb"] = max(peak["rss_mb"], rss_mb())
+        server = [rss_mb(pid) for pid in peak["server_pids"]]
+        if server and None not in server:
+            peak["server_rss_mb"] = max(peak["server_rss_mb"] or 0.0, sum(server))
+        await asyncio.sleep(interval)
+
+
+async def run_level(concurrency: int, args, server_env: dict) -> dict:
+    """在指定并发度下运行一批查询"""
+    from batch import run_query
+    from client import MCPClient
+
+    peak = {"rss_mb": rss_mb(), "server_pids": [], "server_rss_mb": None}
+    sampler = asyncio.create_task(sample_peak_rss(peak))
+    records = []
+    try:
+        async with MCPClient(max_connections=max(concurrency, 10), server_env=server_env) as client:
+            await client.connect(os.path.join(ROOT, "tools.py"))
+            peak["server_pids"] = server_pids()
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for i in range(args.queries):
+                queue.put_nowait((f"c{concurrency}-q{i}", f"benchmark question {concurrency} {i}"))
+
+            async def work():
+                while not queue.empty():
+                    records.append(await run_query(client, *queue.get_nowait()))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(work() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        sampler.cancel()
+
+    latencies = [r["latency_ms"] for r in records if not r["error"]]
+    first_tokens = [r["first_token_ms"] for r in records if r["first_token_ms"] is not None]
+    return {
+        "concurrency": concurrency,
+        "queries": len(records),
+        "errors": sum(1 for r in records if r["error"]),
+        "p50_ms": percentile(latencies, 50) if latencies else None,
+        "p95_ms": percentile(latencies, 95) if latencies else None,
+        "p99_ms": percentile(latencies, 99) if latencies else None,
+        "ttft_mean_ms": round(statistics.mean(first_tokens), 1) if first_tokens else None,
+        "tool_calls": sum(r["tool_calls"] for r in records),
+        "throughput_qps": round(len(records) / elapsed, 2),
+        "peak_rss_mb": round(peak["rss_mb"], 1),  # 客户端进程
+        "server_peak_rss_mb": round(peak["server_rss_mb"], 1) if peak["server_rss_mb"] is not None else None,
+    }
+
+
+def print_table(results: list) -> None:
+    header = f"{'并发':>6}{'查询数':>8}{'错误':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'TTFT(ms)':>10}{'吞吐(q/s)':>11}{'客户端RSS(MB)':>14}{'服务器RSS(MB)':>14}"
+    print(header)
+    for r in results:
+        fmt = lambda v: f"{v:.0f}" if v is not None else "-"  # noqa: E731
+        fmt_mb = lambda v: f"{v:.1f}" if v is not None else "-"  # noqa: E731
+        print(
+            f"{r['concurrency']:>6}{r['queries']:>8}{r['errors']:>6}{fmt(r['p50_ms']):>10}"
+            f"{fmt(r['p95_ms']):>10}{fmt(r['p99_ms']):>10}{fmt(r['ttft_mean_ms']):>10}"
+            f"{r['throughput_qps']:>11.2f}{fmt_mb(r['peak_rss_mb']):>14}{fmt_mb(r['server_peak_rss_mb']):>14}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端基准测试")
+    parser.add_argument("--queries", type=int, default=40, help="每个并发度运行的查询数")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发度列表")
+    parser.add_argument("--json", metavar="PATH", help="把结果写入 JSON 文件，便于对比回归")
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式对话API")
+    parser.add_argument("--no-cache", action="store_true", help="禁用 tools.py 的磁盘 HTTP 缓存")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假对话API首 token 延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="假对话API每 token 间隔（秒）")
+    parser.add_argument("--tool-rounds", type=int, default=2, help="每个查询的工具调用轮数")
+    parser.add_argument("--fanout", type=int, default=3, help="每轮并行 search_url 的数量")
+    parser.add_argument("--web-latency", type=float, default=0.05, help="假网站每个请求的延迟（秒）")
+    parser.add_argument("--page-kb", type=int, default=200, help="假网站文章页大小（KB）")
+    parser.add_argument("--prefetch", type=int, default=0, help="tools.py 预取搜索结果的数量（PREFETCH_TOP_K）")
+    parser.add_argument("--llm-port", type=int, default=0, help="假对话API端口（默认随机；API 地址参与响应缓存的键，LLM_CACHE=replay 重放时需固定）")
+    parser.add_argument("--web-port", type=int, default=0, help="假网站端口（默认随机；LLM_CACHE=replay 重放时需固定）")
+    args = parser.parse_args()
+
+    llm_port, web_port = args.llm_port or free_port(), args.web_port or free_port()
+    web_base = f"http://127.0.0.1:{web_port}"
+    services = [
+        start_service(
+            "bench.fake_web", "--port", str(web_port),
+            "--latency", str(args.web_latency), "--page-kb", str(args.page_kb),
+        ),
+        start_service(
+            "bench.fake_llm", "--port", str(llm_port), "--web-base", web_base,
+            "--latency", str(args.llm_latency), "--token-delay", str(args.token_delay),
+            "--tool-rounds", str(args.tool_rounds), "--fanout", str(args.fanout),
+        ),
+    ]
+
+    os.environ.update({
+        "DS_API_KEY": "bench",
+        "DS_API_BASE": f"http://127.0.0.1:{llm_port}",
+        "API_MODEL_NAME": "fake-model",
+        "API_STREAM": "0" if args.no_stream else "1",
+    })
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            server_env = {
+                "SEARCH_ENGINE_URL": f"{web_base}/search",
+                "HTTP_CACHE_DIR": "" if args.no_cache else cache_dir,
+                "LOGURU_LEVEL": "WARNING",
+                "PREFETCH_TOP_K": str(args.prefetch),
+                # 假网站只有一个主机，不限速，测的是客户端与服务器本身
+                "HTTP_RATE_PER_HOST": "0",
+            }
+            levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+            results = [asyncio.run(run_level(level, args, server_env)) for level in levels]
+    finally:
+        for service in services:
+            service.terminate()
+            service.wait()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+_MISSING = object()
+
+# 磁盘缓存命中时的访问时间先记在内存里，攒够条数或间隔到期时再一次性写入
+ACCESS_FLUSH_SIZE = 128
+ACCESS_FLUSH_INTERVAL = 5.0  # 秒
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目"""
+    value: bytes
+    meta: dict = field(default_factory=dict)
+    stored_at: float = 0.0
+
+    @property
+    def age(self) -> float:
+        """条目已存放的秒数"""
+        return time.time() - self.stored_at
+
+
+class DiskCache:
+    """基于 SQLite 的持久化缓存，按最近访问时间做 LRU 淘汰并限制总容量
+
+    多个进程可以共享同一个缓存文件（WAL 模式）。命中时不立即写库：访问时间
+    批量写入（写入新条目、淘汰和关闭前也会写入），读取路径上只有一次查询。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 不会损坏数据库，断电时最多丢失最近的写入，对缓存可以接受
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                meta TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)"
+        )
+        self._conn.commit()
+        self._accessed: dict = {}  # key -> 尚未写入的访问时间
+        self._flushed_at = time.monotonic()
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[CacheEntry]:
+        """读取条目；条目不存在或超过 max_age 秒时返回 None"""
+        row = self._conn.execute(
+            "SELECT value, meta, stored_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        entry = CacheEntry(value=row[0], meta=json.loads(row[1]), stored_at=row[2])
+        if max_age is not None and entry.age > max_age:
+            return None
+
+        self._accessed[key] = time.time()
+        if (
+            len(self._accessed) >= ACCESS_FLUSH_SIZE
+            or time.monotonic() - self._flushed_at >= ACCESS_FLUSH_INTERVAL
+        ):
+            self.flush()
+        return entry
+
+    def flush(self) -> None:
+        """把内存中记下的访问时间写入数据库"""
+        self._flushed_at = time.monotonic()
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        self._conn.executemany(
+            "UPDATE entries SET accessed_at = ? WHERE key = ?",
+            [(at, key) for key, at in accessed.items()],
+        )
+        self._conn.commit()
+
+    def set(self, key: str, value: bytes, meta: Optional[dict] = None) -> None:
+        """写入条目，必要时淘汰最久未访问的条目"""
+        now = time.time()
+        self._accessed.pop(key, None)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, meta, size, stored_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, value, json.dumps(meta or {}), len(value), now, now),
+        )
+        self._conn.commit()
+        self._evict()
+
+    def touch(self, key: str, meta: Optional[dict] = None) -> None:
+        """刷新条目的存放时间（例如重新验证后），可同时更新元数据"""
+        now = time.time()
+        self._accessed.pop(key, None)
+        if meta is None:
+            self._conn.execute(
+                "UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, key),
+            )
+        else:
+            self._conn.execute(
+                "UPDATE entries SET meta = ?, stored_at = ?, accessed_at = ? WHERE key = ?",
+                (json.dumps(meta), now, now, key),
+            )
+        self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """删除条目"""
+        self._accessed.pop(key, None)
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def total_bytes(self) -> int:
+        """当前缓存占用的字节数"""
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self) -> None:
+        """按 LRU 顺序淘汰条目，直到总容量不超过上限"""
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        # 先写入最近的访问时间，淘汰顺序才准确
+        self.flush()
+
+        evicted = 0
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall()
+        for key, size in rows:
+            if excess <= 0:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            excess -= size
+            evicted += 1
+        self._conn.commit()
+        logger.debug(f"磁盘缓存淘汰 {evicted} 个条目: {self.path}")
+
+    def close(self) -> None:
+        """写入未保存的访问时间并关闭数据库连接"""
+        self.flush()
+        self._conn.close()
+
+
+class MemoryCache:
+    """进程内 LRU 缓存，条目超过 ttl 秒后失效
+
+    on_evict(key, value) 在条目因容量淘汰或过期被丢弃时调用（pop 不触发）。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[str, Any], None]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict = OrderedDict()  # key -> (stored_at, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取条目，不存在或已过期时返回 default"""
+        item = self._data.get(key)
+        if item is None:
+            return default
+        stored_at, value = item
+        if self.ttl is not None and time.time() - stored_at > self.ttl:
+            del self._data[key]
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """写入条目，超出容量时淘汰最久未使用的条目"""
+        self._data[key] = (time.time(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted_key, (_, evicted) = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """移除并返回条目"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        """清空缓存，每个条目都按淘汰处理"""
+        data, self._data = self._data, OrderedDict()
+        if self.on_evict is not None:
+            for key, (_, value) in data.items():
+                self.on_evict(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """内存 + 磁盘两级缓存，值需可 JSON 序列化
+
+    读取时先查内存，未命中再查磁盘并回填内存；写入时同时写两级。
+    """
+
+    def __init__(self, memory: MemoryCache, disk: Optional[DiskCache] = None, ttl: Optional[float] = None):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """依次查询内存与磁盘，均未命中时返回 default"""
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is not None:
+            entry = self.disk.get(key, max_age=self.ttl)
+            if entry is not None:
+                value = json.loads(entry.value)
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value: Any) -> None:
+        """同时写入内存与磁盘"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def close(self) -> None:
+        """关闭磁盘缓存"""
+        if self.disk is not None:
+            self.disk.close()
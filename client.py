@@ -1,31 +1,105 @@
 import asyncio
+import hashlib
 import json
 import os
 import sys
+import time
 from contextlib import AsyncExitStack
-from typing import Optional
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 
-import requests
+import httpx
 from dotenv import load_dotenv
 from loguru import logger
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp import ClientSession, types
+
+from cache import DiskCache, MemoryCache, TieredCache
+from connections import ServerConnection, ServerPool, server_name
+from memory import Conversation, estimate_tokens
+from resilience import CircuitOpenError, Resilience
+from scheduling import FairSemaphore
+from tool_results import (
+    TOOL_RESULT_MAX_TOKENS, TOOL_RESULT_MIN_TOKENS, TOOL_TURN_MAX_TOKENS, fit_tokens, normalize_result, share_budget,
+)
+from tracing import Span, tracer
 
 # 加载环境变量
 load_dotenv()
 
 # 配置常量
 MAX_TOOL_CALLS = 5  # 每轮对话最大工具调用次数
+
+# API 连接配置（连接池与客户端同生命周期，后续轮次复用 TCP/TLS 连接）
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "10"))  # 建立连接超时（秒）
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "30"))  # 读取响应超时（秒）
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "10"))  # 连接池最大连接数
+API_HTTP2 = os.getenv("API_HTTP2", "0") == "1"  # 是否启用 HTTP/2（需安装 h2）
+API_STREAM = os.getenv("API_STREAM", "1") == "1"  # 是否使用流式输出（SSE）
+
+# 工具调用并发配置
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))  # 全局并发工具调用上限（各会话轮流分配）
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "60"))  # 单次工具调用默认超时（秒）
+# 按工具覆盖并发上限与超时，例如 {"search_url": {"concurrency": 3, "timeout": 20}}
+TOOL_LIMITS = json.loads(os.getenv("TOOL_LIMITS", "{}"))
+
+# 对话API响应缓存（按请求内容寻址，用于测试、批量任务和基准测试的确定性重放）
+LLM_CACHE = os.getenv("LLM_CACHE", "off")  # off: 不缓存；on: 读写缓存；replay: 只读，未命中时报错
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".cache")  # 磁盘缓存目录，为空时只用内存
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))  # 内存中缓存的响应数
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 磁盘缓存大小上限
 logger.debug("FastMCP 客户端启动中...")
 
 
+class CompletionCacheMiss(RuntimeError):
+    """重放模式下请求未命中响应缓存"""
+
+
+@dataclass
+class QueryStats:
+    """单次查询的统计信息"""
+    llm_calls: int = 0  # 调用对话API的次数
+    tool_calls: int = 0  # 执行的工具调用数
+    answer: str = ""  # 最终回答（最后一次模型调用的内容，不含调用工具前的中间文本）
+
+
 class MCPClient:
-    def __init__(self):
-        self.session: Optional[ClientSession] = None
+    def __init__(
+        self,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        http2: Optional[bool] = None,
+        pool: Optional[ServerPool] = None,
+        server_env: Optional[dict] = None,
+        llm_cache: Optional[str] = None,
+    ):
         self.exit_stack = AsyncExitStack()
-        self.stdio = None
-        self.write = None
+
+        # 已连接的服务器，以及工具名 -> (连接, 服务器端工具名) 的路由表
+        self.connections: list = []
+        self.tool_routes: dict = {}
+        # 可选的预热连接池：连接时从池中取用，断开时归还
+        self.pool = pool
+        # 额外传给服务器进程的环境变量（默认只继承 PATH/HOME 等基础变量，不泄露 API 密钥）
+        self.server_env = server_env
+        self.connect_time: Optional[float] = None  # 最近一次 connect 到就绪的耗时（秒）
+
+        # 工具目录缓存：连接时构建，仅在服务器通知变更或手动刷新时重建
+        self.available_tools: list = []
+        self._tools_stale = True
+        self.tool_cache_stats = {"hits": 0, "refreshes": 0}
+
+        # 会话历史：session_id -> Conversation
+        self.conversations: dict = {}
+
+        # 工具调用并发控制：全局上限 + 按工具上限，名额在各会话之间轮流分配，
+        # 一个会话的大量工具调用不会让其他会话一直排队
+        self._tool_semaphore = FairSemaphore(TOOL_MAX_CONCURRENCY)
+        self._tool_semaphores: dict = {}
+
+        # 重试、对冲与熔断（对话API按端点，工具按服务器）
+        self.resilience = Resilience()
         
         # API 配置
         self.api_config = {
@@ -35,47 +109,176 @@ class MCPClient:
             "headers": {
                 "Authorization": f"Bearer {os.environ['DS_API_KEY']}",
                 "Content-Type": "application/json"
-            }
+            },
+            "stream": API_STREAM,
         }
 
+        # 异步 HTTP 客户端：长连接池，随 exit_stack 一起关闭
+        self.http = self._create_http_client(
+            connect_timeout or API_CONNECT_TIMEOUT,
+            read_timeout or API_READ_TIMEOUT,
+            max_connections or API_MAX_CONNECTIONS,
+            API_HTTP2 if http2 is None else http2,
+        )
+        self.exit_stack.push_async_callback(self.http.aclose)
+
+        # 对话API响应缓存：off / on / replay
+        self.llm_cache_mode = llm_cache or LLM_CACHE
+        if self.llm_cache_mode not in ("off", "on", "replay"):
+            raise ValueError(f"未知的 LLM_CACHE 模式: {self.llm_cache_mode}")
+        self.completion_cache = self._create_completion_cache() if self.llm_cache_mode != "off" else None
+        self.completion_cache_stats = {"hits": 0, "misses": 0}
+
+    def _create_completion_cache(self) -> TieredCache:
+        """创建对话API响应缓存（内存 + 磁盘），磁盘部分随 exit_stack 关闭"""
+        disk = None
+        if LLM_CACHE_DIR:
+            disk = DiskCache(os.path.join(LLM_CACHE_DIR, "completions.sqlite3"), LLM_CACHE_MAX_BYTES)
+            self.exit_stack.callback(disk.close)
+        return TieredCache(MemoryCache(LLM_CACHE_SIZE), disk)
+
+    def _create_http_client(
+        self, connect_timeout: float, read_timeout: float, max_connections: int, http2: bool
+    ) -> httpx.AsyncClient:
+        """创建带连接池的异步 HTTP 客户端"""
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("未安装 h2，HTTP/2 已禁用，回退到 HTTP/1.1")
+                http2 = False
+
+        return httpx.AsyncClient(
+            base_url=self.api_config["base_url"],
+            headers=self.api_config["headers"],
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            http2=http2,
+        )
+
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.cleanup()
 
-    async def connect(self, server_script: str):
-        """连接到 MCP 服务器"""
-        if not server_script.endswith((".py", ".js")):
-            raise ValueError("服务器脚本必须是 .py 或 .js 文件")
+    @property
+    def session(self) -> Optional[ClientSession]:
+        """第一个服务器的会话（兼容单服务器用法）"""
+        return self.connections[0].session if self.connections else None
 
-        command = "python" if server_script.endswith(".py") else "node"
-        server_params = StdioServerParameters(
-            command=command, args=[server_script], env=None
-        )
+    async def connect(self, *server_scripts: str):
+        """并发连接到一个或多个 MCP 服务器
 
-        # 建立连接
-        self.stdio, self.write = await self.exit_stack.enter_async_context(
-            stdio_client(server_params)
-        )
-        self.session = await self.exit_stack.enter_async_context(
-            ClientSession(self.stdio, self.write)
+        每个服务器可以是本地脚本路径（作为子进程启动），也可以是共享服务器的网址
+        （streamable HTTP，例如 http://host:8000/mcp；以 /sse 结尾时使用 SSE）。
+        各服务器独立启动，慢的服务器不会拖慢其他服务器；部分服务器连接失败时
+        记录错误并继续使用其余服务器，全部失败时抛出第一个异常。
+        """
+        if not server_scripts:
+            raise ValueError("至少需要一个服务器脚本")
+
+        started = time.perf_counter()
+        names = set(conn.name for conn in self.connections)
+        server_names = []
+        for script in server_scripts:
+            # 服务器重名时追加序号
+            base = name = server_name(script)
+            index = 2
+            while name in names:
+                name = f"{base}{index}"
+                index += 1
+            names.add(name)
+            server_names.append(name)
+
+        results = await asyncio.gather(
+            *(self._open_connection(script, name) for script, name in zip(server_scripts, server_names)),
+            return_exceptions=True,
         )
+        errors = []
+        for script, result in zip(server_scripts, results):
+            if isinstance(result, BaseException):
+                logger.error(f"连接服务器 {script} 失败: {result}")
+                errors.append(result)
+            else:
+                self.connections.append(result)
 
-        await self.session.initialize()
-        await self._log_available_tools()
+        if len(errors) == len(server_scripts):
+            raise errors[0]
 
-    async def _log_available_tools(self):
-        """记录可用工具信息"""
-        response = await self.session.list_tools()
-        tools_info = [
-            [tool.name, tool.description, tool.inputSchema] 
-            for tool in response.tools
-        ]
-        logger.info(f"可用工具: {tools_info}")
+        await self.refresh_tools()
+        self.connect_time = time.perf_counter() - started
+        logger.info(f"连接完成，{len(self.connections)} 个服务器就绪，耗时 {self.connect_time * 1000:.0f} ms")
 
-    def _call_api(self, messages: list, tools: list = None) -> dict:
-        """调用对话API"""
+    async def _open_connection(self, script: str, name: str) -> ServerConnection:
+        """建立单个服务器连接（优先从连接池取用），并登记到 exit_stack 中释放"""
+        if self.pool is not None:
+            connection = await self.pool.acquire(script, name, self._handle_message)
+            self.exit_stack.push_async_callback(self.pool.release, connection)
+            return connection
+
+        connection = ServerConnection(script, name, self._handle_message, self.server_env)
+        self.exit_stack.push_async_callback(connection.close)
+        return await connection.open()
+
+    async def _handle_message(self, message) -> None:
+        """处理服务器推送的消息，工具列表变更时使缓存失效"""
+        if isinstance(message, types.ServerNotification) and isinstance(
+            message.root, types.ToolListChangedNotification
+        ):
+            logger.info("服务器工具列表已变更，将在下次使用前刷新")
+            self._tools_stale = True
+
+    async def refresh_tools(self) -> list:
+        """重新获取所有服务器的工具列表，合并成 OpenAI function 格式并重建路由表
+
+        工具重名时先连接的服务器保留原名，后面的加上 "<服务器名>_" 前缀。
+        """
+        await asyncio.gather(*(connection.list_tools() for connection in self.connections))
+
+        routes = {}
+        available_tools = []
+        for connection in self.connections:
+            tools_info = [
+                [tool.name, tool.description, tool.inputSchema] 
+                for tool in connection.tools
+            ]
+            logger.info(f"服务器 {connection.name} 可用工具: {tools_info}")
+
+            for tool in connection.tools:
+                name = tool.name
+                if name in routes:
+                    name = f"{connection.name}_{tool.name}"
+                    logger.warning(f"工具名冲突: {tool.name}，服务器 {connection.name} 的工具重命名为 {name}")
+                routes[name] = (connection, tool.name)
+                available_tools.append({
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "description": tool.description,
+                        "parameters": getattr(tool, "inputSchema", {}),
+                    },
+                })
+
+        self.tool_routes = routes
+        self.available_tools = available_tools
+        self._tools_stale = False
+        self.tool_cache_stats["refreshes"] += 1
+        logger.debug(f"工具缓存统计: {self.tool_cache_stats}")
+        return self.available_tools
+
+    async def _get_tools(self) -> list:
+        """返回缓存的工具描述，缓存失效时先刷新"""
+        if self._tools_stale:
+            return await self.refresh_tools()
+        self.tool_cache_stats["hits"] += 1
+        return self.available_tools
+
+    def _build_payload(self, messages: list, tools: list = None) -> dict:
+        """构造对话API请求体"""
         payload = {
             "model": self.api_config["model"],
             "messages": messages,
@@ -84,99 +287,432 @@ class MCPClient:
         
         if tools:
             payload["tools"] = tools
+        return payload
+
+    def _completion_key(self, payload: dict) -> str:
+        """请求的内容哈希：API 地址、模型、消息、工具与采样参数相同则键相同（与是否流式无关）
+
+        API 地址参与计算，不同服务商的同名模型不共用缓存。
+        """
+        canonical = {k: v for k, v in payload.items() if k not in ("stream", "stream_options")}
+        canonical["base_url"] = self.api_config["base_url"].rstrip("/")
+        data = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _cached_completion(self, key: Optional[str], span: Optional[Span] = None) -> Optional[dict]:
+        """查询响应缓存；重放模式下未命中时抛出 CompletionCacheMiss"""
+        if key is None:
+            return None
+        cached = self.completion_cache.get(key)
+        if cached is not None:
+            self.completion_cache_stats["hits"] += 1
+            if span is not None:
+                span.set(cache="hit")
+            return cached
+
+        self.completion_cache_stats["misses"] += 1
+        if span is not None:
+            span.set(cache="miss")
+        if self.llm_cache_mode == "replay":
+            raise CompletionCacheMiss(f"重放模式下响应缓存未命中: {key[:16]}")
+        return None
+
+    def _store_completion(self, key: Optional[str], response: dict) -> None:
+        """在 on 模式下缓存成功的响应"""
+        if key is not None and self.llm_cache_mode == "on":
+            self.completion_cache.set(key, response)
+
+    @staticmethod
+    def _record_usage(span: Optional[Span], usage: Optional[dict]) -> None:
+        """把API返回的 token 用量记录到 span"""
+        if span is not None and usage:
+            span.set(
+                prompt_tokens=usage.get("prompt_tokens", 0),
+                completion_tokens=usage.get("completion_tokens", 0),
+            )
+
+    async def _call_api(self, messages: list, tools: list = None, span: Optional[Span] = None) -> dict:
+        """调用对话API"""
+        payload = self._build_payload(messages, tools)
+        key = self._completion_key(payload) if self.completion_cache is not None else None
+        cached = self._cached_completion(key, span)
+        if cached is not None:
+            return cached
 
         try:
-            response = requests.post(
-                f"{self.api_config['base_url']}/chat/completions",
-                headers=self.api_config["headers"],
-                json=payload,
-                timeout=30
+            response = await self.resilience.send(
+                "llm", "llm", lambda: self.http.post("/chat/completions", json=payload)
             )
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            data = response.json()
+        except (httpx.HTTPError, CircuitOpenError) as e:
             logger.error(f"API调用失败: {e}")
             raise
+        self._record_usage(span, data.get("usage"))
+        self._store_completion(key, data)
+        return data
+
+    async def _stream_api(
+        self, messages: list, tools: list = None, span: Optional[Span] = None
+    ) -> AsyncIterator[tuple]:
+        """以流式方式调用对话API，边接收 SSE 增量边产出事件
+
+        产出:
+            ("text", str): 回复文本增量
+            ("tool_call", dict): 参数已接收完整的工具调用
+            ("message", dict): 流结束后组装出的完整助手消息
+        """
+        payload = self._build_payload(messages, tools)
+        key = self._completion_key(payload) if self.completion_cache is not None else None
+        cached = self._cached_completion(key, span)
+        if cached is not None:
+            # 命中缓存时按流式事件的顺序一次性产出
+            message = cached["choices"][0]["message"]
+            if message.get("content"):
+                yield "text", message["content"]
+            for call in message.get("tool_calls") or []:
+                yield "tool_call", call
+            yield "message", message
+            return
+
+        payload["stream"] = True
+        # 让流的最后一个分块带上 token 用量
+        payload["stream_options"] = {"include_usage": True}
+
+        content_parts = []
+        partial_calls: dict = {}  # 调用序号 -> 正在拼接的工具调用
+        emitted = set()
+        usage = None
+        finish_reason = None
 
-    async def _process_tool_calls(self, tool_calls: list, messages: list) -> None:
-        """处理工具调用并将结果加入消息历史"""
-        for call in tool_calls:
+        def arguments_complete(call: dict) -> bool:
             try:
-                tool_name = call["function"]["name"]
-                args = json.loads(call["function"]["arguments"])
-                
-                logger.debug(f"调用工具: {tool_name}，参数: {args}")
-                result = await self.session.call_tool(tool_name, args)
-                
-                # 确保结果为字符串
-                if isinstance(result, bytes):
-                    result = result.decode('utf-8', errors='replace')
-                result = str(result)
-                
-                messages.append({
-                    "role": "tool",
-                    "content": result,
-                    "tool_call_id": call["id"]
-                })
-                
-            except Exception as e:
-                logger.error(f"工具调用失败: {e}")
-                messages.append({
-                    "role": "tool",
-                    "content": f"Error: {str(e)}",
-                    "tool_call_id": call["id"]
-                })
+                return isinstance(json.loads(call["function"]["arguments"]), dict)
+            except ValueError:
+                return False
+
+        def completed_calls(before: Optional[int] = None):
+            """返回参数已完整但尚未产出的调用
+
+            给出 before 时只返回序号小于它、且参数已是完整 JSON 的调用：
+            部分服务商会交错发送多个调用的增量，出现新序号不代表之前的调用已经结束。
+            """
+            ready = []
+            for index in sorted(partial_calls):
+                if index in emitted:
+                    continue
+                if before is not None and (index >= before or not arguments_complete(partial_calls[index])):
+                    continue
+                emitted.add(index)
+                ready.append(partial_calls[index])
+            return ready
+
+        async def send() -> httpx.Response:
+            request = self.http.build_request("POST", "/chat/completions", json=payload)
+            return await self.http.send(request, stream=True)
+
+        try:
+            # 重试与对冲作用于收到响应头之前，开始产出内容后不再重发
+            response = await self.resilience.send("llm", "llm", send)
+            try:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                        self._record_usage(span, usage)
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta") or {}
+                        if span is not None and "first_token_ms" not in span.attrs and (
+                            delta.get("content") or delta.get("tool_calls")
+                        ):
+                            span.set(first_token_ms=round(span.elapsed_ms(), 1))
+                        if delta.get("content"):
+                            content_parts.append(delta["content"])
+                            yield "text", delta["content"]
 
-    async def query(self, user_input: str) -> str:
-        """处理用户查询并返回响应"""
-        messages = [{"role": "user", "content": user_input+".如果不能使用手中工具回答请告诉我不能的原因, 要求使用的工具次数尽量少"}]
+                        for tool_delta in delta.get("tool_calls") or []:
+                            index = tool_delta.get("index", 0)
+                            # 出现新的调用序号时，之前参数已完整的调用可以先开始执行
+                            for call in completed_calls(before=index):
+                                yield "tool_call", call
+
+                            call = partial_calls.setdefault(index, {
+                                "id": "",
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""},
+                            })
+                            if tool_delta.get("id"):
+                                call["id"] = tool_delta["id"]
+                            function = tool_delta.get("function") or {}
+                            call["function"]["name"] += function.get("name") or ""
+                            call["function"]["arguments"] += function.get("arguments") or ""
+
+                        if choice.get("finish_reason"):
+                            finish_reason = choice["finish_reason"]
+                            for call in completed_calls():
+                                yield "tool_call", call
+            finally:
+                await response.aclose()
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            logger.error(f"API调用失败: {e}")
+            raise
+
+        for call in completed_calls():
+            yield "tool_call", call
+
+        message = {"role": "assistant", "content": "".join(content_parts)}
+        if partial_calls:
+            message["tool_calls"] = [partial_calls[i] for i in sorted(partial_calls)]
+        # 以非流式响应的格式缓存，两种模式共用同一份缓存
+        self._store_completion(key, {
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+        yield "message", message
+
+    def _tool_limit(self, tool_name: str) -> FairSemaphore:
+        """返回指定工具的并发信号量，未配置上限时使用全局上限"""
+        if tool_name not in self._tool_semaphores:
+            limit = TOOL_LIMITS.get(tool_name, {}).get("concurrency", TOOL_MAX_CONCURRENCY)
+            self._tool_semaphores[tool_name] = FairSemaphore(limit)
+        return self._tool_semaphores[tool_name]
+
+    async def _run_tool_call(
+        self, call: dict, parent: Optional[Span] = None, session_id: str = "default"
+    ) -> dict:
+        """执行单个工具调用（受并发上限与超时约束），返回对应的 tool 消息
+
+        并发名额按 session_id 在各会话之间轮流分配。
+        """
+        tool_name = call["function"]["name"]
+        timeout = TOOL_LIMITS.get(tool_name, {}).get("timeout", TOOL_CALL_TIMEOUT)
+        span = tracer.start_span("tool", parent, tool=tool_name)
+        try:
+            args = json.loads(call["function"]["arguments"] or "{}")
+            
+            if tool_name not in self.tool_routes:
+                raise ValueError(f"未知工具: {tool_name}")
+            connection, server_tool_name = self.tool_routes[tool_name]
+            span.set(server=connection.name)
+            
+            # 先占用工具自身的名额，再占用全局名额，避免排队时占着全局名额
+            async with self._tool_limit(tool_name).slot(session_id), self._tool_semaphore.slot(session_id):
+                span.set(wait_ms=round(span.elapsed_ms(), 1))
+                logger.debug(f"调用工具: {tool_name}（服务器 {connection.name}），参数: {args}")
+                # 工具调用不一定幂等，不重试；同一服务器连续超时或出错时熔断、快速失败
+                async with self.resilience.guard(f"tool:{connection.name}", "tool"):
+                    result = await asyncio.wait_for(
+                        connection.session.call_tool(server_tool_name, args, meta=tracer.context(span)),
+                        timeout,
+                    )
+            
+            # 提取紧凑的文本/JSON，并限制单个结果的长度
+            result = fit_tokens(normalize_result(result), TOOL_RESULT_MAX_TOKENS)
+            span.set(result_bytes=len(result.encode("utf-8")), result_tokens=estimate_tokens(result))
+            span.end()
+            
+            return {
+                "role": "tool",
+                "content": result,
+                "tool_call_id": call["id"]
+            }
+            
+        except asyncio.CancelledError:
+            span.end("cancelled")
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"工具调用超时: {tool_name}（{timeout}s）")
+            span.end("timeout")
+            return {
+                "role": "tool",
+                "content": f"Error: 工具 {tool_name} 调用超时（{timeout}s）",
+                "tool_call_id": call["id"]
+            }
+        except Exception as e:
+            logger.error(f"工具调用失败: {e}")
+            span.set(error=str(e))
+            span.end("error")
+            return {
+                "role": "tool",
+                "content": f"Error: {str(e)}",
+                "tool_call_id": call["id"]
+            }
+
+    @staticmethod
+    def _fit_turn_budget(results: list, budget: int) -> tuple:
+        """把一批工具结果压缩到本轮剩余的 token 预算内，返回 (结果列表, 占用的 token 数)"""
+        counts = [estimate_tokens(result["content"]) for result in results]
+        if sum(counts) <= budget:
+            return results, sum(counts)
+
+        shares = share_budget(counts, budget)
+        fitted = [
+            {**result, "content": fit_tokens(result["content"], share)} if share < count else result
+            for result, count, share in zip(results, counts, shares)
+        ]
+        logger.info(f"工具结果超出本轮预算，已从约 {sum(counts)} tokens 压缩到 {sum(shares)} tokens")
+        return fitted, sum(shares)
+
+    async def _process_tool_calls(
+        self, tool_calls: list, messages: list, parent: Optional[Span] = None, session_id: str = "default"
+    ) -> None:
+        """并发处理工具调用，并按原始 tool_call_id 顺序将结果加入消息历史"""
+        results = await asyncio.gather(*(self._run_tool_call(call, parent, session_id) for call in tool_calls))
+        messages.extend(results)
+
+    def conversation(self, session_id: str = "default") -> Conversation:
+        """返回指定会话的历史记录，不存在时创建"""
+        if session_id not in self.conversations:
+            self.conversations[session_id] = Conversation()
+        return self.conversations[session_id]
+
+    def reset_conversation(self, session_id: str = "default") -> None:
+        """清空指定会话的历史记录"""
+        self.conversations.pop(session_id, None)
+
+    async def query(
+        self, user_input: str, session_id: str = "default", stats: Optional[QueryStats] = None
+    ) -> str:
+        """处理用户查询并返回最终回答（不含调用工具前的中间文本）"""
+        stats = stats if stats is not None else QueryStats()
+        async for _ in self.query_stream(user_input, session_id, stats):
+            pass
+        return stats.answer
+
+    async def query_stream(
+        self, user_input: str, session_id: str = "default", stats: Optional[QueryStats] = None
+    ) -> AsyncIterator[str]:
+        """处理用户查询，以异步生成器形式逐段产出回复文本
+
+        产出的文本包含每次模型调用的内容；调用工具前的中间文本（如"让我搜索一下"）
+        之后会产出一个空行，与后续文本分开。最终回答另外记录在 stats.answer 中。
+
+        同一 session_id 的多次查询共享对话历史，历史按 token 预算自动压缩。
+        传入 stats 时会累计本次查询的模型调用与工具调用次数。
+        """
+        stats = stats if stats is not None else QueryStats()
+        conversation = self.conversation(session_id)
+        conversation.start_turn(
+            {"role": "user", "content": user_input+".如果不能使用手中工具回答请告诉我不能的原因, 要求使用的工具次数尽量少"},
+            question=user_input,
+        )
         tool_calls_count = 0
+        tool_tokens_left = TOOL_TURN_MAX_TOKENS  # 本轮工具结果剩余的 token 预算
+        completed = False
+        turn = tracer.start_span("turn", session=session_id)
         
-        while True:
-            # 获取可用工具
-            tools_response = await self.session.list_tools()
-            available_tools = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": getattr(tool, "inputSchema", {}),
-                    },
-                }
-                for tool in tools_response.tools
-            ] if tool_calls_count < MAX_TOOL_CALLS else None
+        try:
+            while True:
+                # 获取可用工具（使用缓存的工具目录）；工具轮数或本轮工具结果预算用完后
+                # 不再提供工具，让模型根据已有结果作答
+                if tool_calls_count < MAX_TOOL_CALLS and tool_tokens_left >= TOOL_RESULT_MIN_TOKENS:
+                    available_tools = await self._get_tools()
+                else:
+                    available_tools = None
+                conversation.compact()
+                messages = conversation.messages()
 
-            # 获取模型响应
-            response = self._call_api(messages, available_tools)
-            message = response["choices"][0]["message"]
-            
-            # 添加助手消息到历史
-            msg = {"role": "assistant", "content": message.get("content", "")}
-            if "tool_calls" in message:
-                msg["tool_calls"] = message["tool_calls"]
-            messages.append(msg)
+                # 获取模型响应；流式模式下参数完整的工具调用立即开始执行
+                pending = []
+                stats.llm_calls += 1
+                llm_span = turn.child("llm", messages=len(messages))
+                try:
+                    with llm_span:
+                        if self.api_config["stream"]:
+                            message = None
+                            async for kind, data in self._stream_api(messages, available_tools, llm_span):
+                                if kind == "text":
+                                    yield data
+                                elif kind == "tool_call" and available_tools:
+                                    pending.append(asyncio.create_task(self._run_tool_call(data, turn, session_id)))
+                                elif kind == "message":
+                                    message = data
+                        else:
+                            response = await self._call_api(messages, available_tools, llm_span)
+                            message = response["choices"][0]["message"]
+                            if message.get("content"):
+                                yield message["content"]
+                except BaseException:
+                    for task in pending:
+                        task.cancel()
+                    raise
+                
+                # 检查是否需要工具调用
+                if not message.get("tool_calls") or not available_tools:
+                    for task in pending:
+                        task.cancel()
+                    # 未执行的工具调用不写入历史，保证后续请求的消息合法
+                    conversation.append({"role": "assistant", "content": message.get("content", "")})
+                    stats.answer = message.get("content") or ""
+                    completed = True
+                    return
+
+                # 调用工具前的中间文本与之后的回答之间加空行分隔
+                if message.get("content"):
+                    yield "\n\n"
 
-            # 检查是否需要工具调用
-            if not message.get("tool_calls") or tool_calls_count >= MAX_TOOL_CALLS:
-                return message.get("content", "")
+                # 添加助手消息到历史
+                conversation.append({
+                    "role": "assistant",
+                    "content": message.get("content", ""),
+                    "tool_calls": message["tool_calls"],
+                })
 
-            # 处理工具调用
-            await self._process_tool_calls(message["tool_calls"], messages)
-            tool_calls_count += 1
+                # 处理工具调用
+                if pending:
+                    results = await asyncio.gather(*pending)
+                    # 交错的增量可能让后面的调用先开始执行，结果按助手消息中的调用顺序排列
+                    order = {call["id"]: i for i, call in enumerate(message["tool_calls"])}
+                    results.sort(key=lambda result: order.get(result["tool_call_id"], len(order)))
+                else:
+                    results = []
+                    await self._process_tool_calls(message["tool_calls"], results, turn, session_id)
+                results, used = self._fit_turn_budget(results, tool_tokens_left)
+                tool_tokens_left -= used
+                conversation.extend(results)
+                stats.tool_calls += len(results)
+                tool_calls_count += 1
+        finally:
+            if not completed:
+                conversation.abort_turn()
+            turn.set(llm_calls=stats.llm_calls, tool_calls=stats.tool_calls)
+            turn.end("ok" if completed else "aborted")
+            logger.info(f"会话 {session_id} {turn.summary()}")
 
     async def interactive_chat(self):
         """交互式聊天界面"""
-        print("\nMCP 客户端已就绪！输入问题或 'quit' 退出")
+        print("\nMCP 客户端已就绪！输入问题、'refresh' 刷新工具列表、'reset' 清空对话历史、'metrics' 查看指标或 'quit' 退出")
         
         while True:
             try:
                 user_input = input("\nQuery: ").strip()
                 if user_input.lower() == "quit":
                     break
+                if user_input.lower() == "refresh":
+                    await self.refresh_tools()
+                    print(f"\n工具列表已刷新，缓存统计: {self.tool_cache_stats}")
+                    continue
+                if user_input.lower() == "metrics":
+                    print(tracer.metrics.render())
+                    if self.completion_cache is not None:
+                        print(f"响应缓存统计: {self.completion_cache_stats}")
+                    continue
+                if user_input.lower() == "reset":
+                    self.reset_conversation()
+                    print("\n对话历史已清空")
+                    continue
                     
-                response = await self.query(user_input)
-                print(f"\n{response}")
+                print()
+                async for chunk in self.query_stream(user_input):
+                    print(chunk, end="", flush=True)
+                print()
                 
             except Exception as e:
                 logger.error(f"处理查询时出错: {e}")
@@ -189,11 +725,11 @@ class MCPClient:
 
 async def main():
     if len(sys.argv) < 2:
-        print("用法: python client.py <服务器脚本路径>")
+        print("用法: python client.py <服务器脚本路径或网址> [更多服务器脚本路径或网址...]")
         return
 
     async with MCPClient() as client:
-        await client.connect(sys.argv[1])
+        await client.connect(*sys.argv[1:])
         await client.interactive_chat()
 
 
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import re
+import time
+from contextlib import AsyncExitStack
+from typing import Optional
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamable_http_client
+
+import tracing
+
+# 每个服务器脚本在池中保持的预热连接数
+SERVER_POOL_SIZE = int(os.getenv("SERVER_POOL_SIZE", "1"))
+
+# 本地启动的服务器进程只继承 PATH/HOME 等基础变量；这些前缀的工具服务器配置
+# （含 .env 中的）会从客户端环境转发过去，API 密钥等其他变量不转发
+SERVER_ENV_PREFIXES = (
+    "HTTP_", "SEARCH_", "PREFETCH_", "EXTRACT_", "SAVE_FILE_",
+    "RETRY_", "HEDGE", "BREAKER_", "RESILIENCE_",
+)
+
+
+def is_url(target: str) -> bool:
+    """服务器目标是网络地址（streamable HTTP / SSE）而不是本地脚本"""
+    return target.startswith(("http://", "https://"))
+
+
+def forwarded_env() -> dict:
+    """客户端环境中需要转发给服务器进程的配置变量"""
+    return {key: value for key, value in os.environ.items() if key.startswith(SERVER_ENV_PREFIXES)}
+
+
+def server_name(target: str) -> str:
+    """根据服务器脚本路径或网址生成简短名称（用于日志和工具重名时的前缀）"""
+    if is_url(target):
+        name = urlsplit(target).hostname or ""
+    else:
+        name = os.path.splitext(os.path.basename(target.rstrip("/")))[0]
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", name) or "server"
+
+
+class ServerConnection:
+    """单个 MCP 服务器连接
+
+    target 可以是本地脚本（.py / .js，以 stdio 子进程方式启动），也可以是网络服务的地址：
+    路径以 /sse 结尾时使用 SSE，否则使用 streamable HTTP（例如 http://host:8000/mcp）。
+
+    MCP 的客户端传输基于 anyio 任务组，其上下文必须在同一个任务中进入和退出，
+    因此每个连接都在自己的后台任务中建立并保持，直到 close() 被调用。
+    这样多个服务器可以并发启动，也可以在任意任务中关闭。
+    """
+
+    def __init__(
+        self, target: str, name: Optional[str] = None, message_handler=None, env: Optional[dict] = None
+    ):
+        self.target = target
+        self.env = env  # 额外传给服务器进程的环境变量
+        self.name = name or server_name(target)
+        self.session: Optional[ClientSession] = None
+        self.tools: list = []
+        self.message_handler = message_handler
+        self.ready_time: Optional[float] = None  # 从启动到 initialize 完成的耗时（秒）
+        self._ready: Optional[asyncio.Future] = None
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _server_params(self) -> StdioServerParameters:
+        if not self.target.endswith((".py", ".js")):
+            raise ValueError("服务器脚本必须是 .py 或 .js 文件")
+
+        command = "python" if self.target.endswith(".py") else "node"
+        # 工具服务器配置与追踪配置随之传递，服务器端的 span 写入同一文件
+        env = {**forwarded_env(), **tracing.server_env(), **(self.env or {})} or None
+        return StdioServerParameters(command=command, args=[self.target], env=env)
+
+    def _transport(self):
+        """返回目标对应的客户端传输上下文"""
+        if is_url(self.target):
+            if urlsplit(self.target).path.rstrip("/").endswith("/sse"):
+                return sse_client(self.target)
+            return streamable_http_client(self.target)
+        return stdio_client(self._server_params())
+
+    async def open(self) -> "ServerConnection":
+        """启动（或连接）服务器并完成 initialize，返回自身"""
+        transport = self._transport()
+        started = time.perf_counter()
+        self._ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(transport), name=f"mcp-server-{self.name}")
+        await asyncio.shield(self._ready)
+        self.ready_time = time.perf_counter() - started
+        logger.info(f"服务器 {self.name} 就绪，耗时 {self.ready_time * 1000:.0f} ms")
+        return self
+
+    @property
+    def alive(self) -> bool:
+        """连接是否仍然可用"""
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _dispatch_message(self, message) -> None:
+        """把服务器推送的消息转发给当前使用者（连接池复用时会更换使用者）"""
+        if self.message_handler is not None:
+            await self.message_handler(message)
+
+    async def _run(self, transport) -> None:
+        """在独立任务中持有连接上下文，直到收到关闭信号"""
+        try:
+            async with AsyncExitStack() as stack:
+                # streamable HTTP 额外返回获取会话 ID 的回调，这里不需要
+                read, write, *_ = await stack.enter_async_context(transport)
+                session = await stack.enter_async_context(
+                    ClientSession(read, write, message_handler=self._dispatch_message)
+                )
+                await session.initialize()
+                self.session = session
+                self._ready.set_result(None)
+                await self._closing.wait()
+        except BaseException as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                logger.error(f"服务器 {self.name} 连接异常退出: {e}")
+        finally:
+            self.session = None
+
+    async def list_tools(self) -> list:
+        """获取并记录该服务器的工具列表"""
+        response = await self.session.list_tools()
+        self.tools = response.tools
+        return self.tools
+
+    async def close(self) -> None:
+        """关闭连接并等待后台任务退出"""
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except BaseException as e:
+                logger.debug(f"关闭服务器 {self.name} 时出错: {e}")
+            self._task = None
+
+
+class ServerPool:
+    """预热的 MCP 服务器连接池
+
+    为每个服务器脚本保持若干个已完成 initialize 的空闲连接，connect 时直接取用，
+    同时在后台补充新的预热连接；客户端断开时连接归还池中以便下次复用。
+    这样 GUI 重连和批量任务都无需等待服务器进程冷启动。
+    """
+
+    def __init__(self, size: int = SERVER_POOL_SIZE, env: Optional[dict] = None):
+        self.size = size
+        self.env = env
+        self._idle: dict = {}  # target -> [ServerConnection]
+        self._warming: dict = {}  # target -> {asyncio.Task}
+        self._closed = False
+
+    def warm(self, target: str) -> None:
+        """在后台补充预热连接，直到空闲 + 预热中的数量达到池大小"""
+        if self._closed:
+            return
+        warming = self._warming.setdefault(target, set())
+        missing = self.size - len(self._idle.get(target, [])) - len(warming)
+        for _ in range(max(missing, 0)):
+            task = asyncio.create_task(self._warm_one(target))
+            warming.add(task)
+            task.add_done_callback(warming.discard)
+
+    async def prewarm(self, target: str) -> None:
+        """补充预热连接并等待其就绪"""
+        self.warm(target)
+        await asyncio.gather(*self._warming.get(target, ()), return_exceptions=True)
+
+    async def _warm_one(self, target: str) -> None:
+        connection = ServerConnection(target, env=self.env)
+        try:
+            await connection.open()
+        except BaseException as e:
+            await connection.close()
+            if not isinstance(e, Exception):
+                raise
+            logger.error(f"预热服务器 {target} 失败: {e}")
+            return
+        if self._closed:
+            await connection.close()
+            return
+        self._idle.setdefault(target, []).append(connection)
+
+    def _pop_idle(self, target: str) -> Optional[ServerConnection]:
+        idle = self._idle.get(target, [])
+        while idle:
+            connection = idle.pop()
+            if connection.alive:
+                return connection
+            asyncio.create_task(connection.close())
+        return None
+
+    async def acquire(self, target: str, name: Optional[str] = None, message_handler=None) -> ServerConnection:
+        """取出一个已就绪的连接；没有空闲连接时等待预热中的连接或直接新建"""
+        started = time.perf_counter()
+        connection = self._pop_idle(target)
+        if connection is None and self._warming.get(target):
+            await asyncio.wait(set(self._warming[target]), return_when=asyncio.FIRST_COMPLETED)
+            connection = self._pop_idle(target)
+        if connection is None:
+            connection = await ServerConnection(target, env=self.env).open()
+        else:
+            logger.info(
+                f"从连接池取得服务器 {connection.name}，耗时 {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+
+        if name:
+            connection.name = name
+        connection.message_handler = message_handler
+        self.warm(target)
+        return connection
+
+    async def release(self, connection: ServerConnection) -> None:
+        """归还连接：连接可用且池未满时放回空闲列表，否则关闭"""
+        connection.message_handler = None
+        idle = self._idle.setdefault(connection.target, [])
+        if not self._closed and connection.alive and len(idle) < self.size:
+            idle.append(connection)
+        else:
+            await connection.close()
+
+    async def aclose(self) -> None:
+        """关闭池中所有空闲和预热中的连接"""
+        self._closed = True
+        for tasks in self._warming.values():
+            for task in list(tasks):
+                task.cancel()
+        await asyncio.gather(
+            *(task for tasks in self._warming.values() for task in tasks), return_exceptions=True
+        )
+        await asyncio.gather(
+            *(connection.close() for idle in self._idle.values() for connection in idle)
+        )
+        self._idle.clear()
@@ -0,0 +1,130 @@
+import os
+from html.parser import HTMLParser
+from typing import Optional
+
+from loguru import logger
+
+# 文本提取配置
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "auto")  # auto | stream | selectolax | bs4
+
+# 不包含正文的标签，其内部文本全部跳过
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+
+class TextExtractor(HTMLParser):
+    """增量式 HTML 正文提取器
+
+    可以边下载边 feed，累计到 limit 个字符后即停止解析，
+    不构建 DOM 树，内存占用与页面大小无关。
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.lines: list = []
+        self.length = 0
+        self.done = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.done or self._skip_depth:
+            return
+        line = data.strip()
+        if not line:
+            return
+        self.lines.append(line)
+        self.length += len(line) + 1
+        if self.limit is not None and self.length >= self.limit:
+            self.done = True
+
+    def feed(self, data: str) -> bool:
+        """喂入一段 HTML，已提取到足够文本时返回 True"""
+        if not self.done:
+            super().feed(data)
+        return self.done
+
+    def close(self):
+        if not self.done:
+            super().close()
+
+    def text(self) -> str:
+        """返回已提取的文本（按行分隔）"""
+        text = "\n".join(self.lines)
+        return text[:self.limit] if self.limit is not None else text
+
+
+# 增量解析时每次喂入的字符数
+FEED_CHUNK_SIZE = 16 * 1024
+
+
+def _extract_stream(html: str, limit: Optional[int]) -> str:
+    extractor = TextExtractor(limit)
+    for start in range(0, len(html), FEED_CHUNK_SIZE):
+        if extractor.feed(html[start:start + FEED_CHUNK_SIZE]):
+            break
+    extractor.close()
+    return extractor.text()
+
+
+def _extract_selectolax(html: str, limit: Optional[int]) -> str:
+    from selectolax.parser import HTMLParser as LexborParser
+
+    tree = LexborParser(html)
+    tree.strip_tags(list(SKIP_TAGS))
+    root = tree.body or tree.root
+    if root is None:
+        return ""
+    text = "\n".join(line.strip() for line in root.text(separator="\n").split("\n") if line.strip())
+    return text[:limit] if limit is not None else text
+
+
+def _extract_bs4(html: str, limit: Optional[int]) -> str:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(['script', 'style', 'noscript', 'meta', 'link']):
+        element.decompose()
+    text = soup.get_text('\n', strip=True)
+    text = '\n'.join([line for line in text.split('\n') if line.strip()])
+    return text[:limit] if limit is not None else text
+
+
+BACKENDS = {
+    "stream": _extract_stream,
+    "selectolax": _extract_selectolax,
+    "bs4": _extract_bs4,
+}
+
+
+def resolve_backend(backend: str = EXTRACT_BACKEND) -> str:
+    """解析提取后端，auto 时优先使用已安装的 selectolax"""
+    if backend != "auto":
+        return backend
+    try:
+        import selectolax  # noqa: F401
+        return "selectolax"
+    except ImportError:
+        return "stream"
+
+
+def extract_text(html: str, limit: Optional[int] = None, backend: str = EXTRACT_BACKEND) -> str:
+    """从 HTML 中提取正文文本，最多返回 limit 个字符
+
+    首选后端失败时回退到 BeautifulSoup(html.parser)。
+    """
+    backend = resolve_backend(backend)
+    try:
+        return BACKENDS[backend](html, limit)
+    except Exception as e:
+        if backend == "bs4":
+            raise
+        logger.warning(f"{backend} 提取失败，回退到 html.parser: {e}")
+        return _extract_bs4(html, limit)
@@ -1,11 +1,17 @@
-import sys
 import os
+import argparse
 import asyncio
+import queue
+import threading
+import time
 import tkinter as tk
-from tkinter import scrolledtext, filedialog, messagebox
+from tkinter import scrolledtext, filedialog, messagebox, ttk
 from typing import Optional
 import logging
-from client import MCPClient
+from batch import BATCH_CONCURRENCY, run_batch
+from client import API_MAX_CONNECTIONS, MCPClient
+from connections import ServerPool
+from tracing import tracer
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -17,14 +23,146 @@ MAX_TOOL_CALLS = 5
 # 默认服务器路径
 DEFAULT_SERVER_PATH = "./tools.py"
 
+# 聊天区域只保留最近的内容，更早的部分追加写入归档文件，长时间会话的内存占用保持平稳
+CHAT_MAX_LINES = int(os.getenv("CHAT_MAX_LINES", "2000"))  # 聊天区域保留的最大行数
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", ".cache/chat")  # 归档目录，为空时直接丢弃
+
+class ChatTab:
+    """一个对话标签页：独立的会话历史（session_id）、聊天区域、输入框和状态栏
+
+    各标签页共用同一个已连接的 MCPClient，查询可以同时进行；
+    同一标签页内的查询依次进行，保证对话历史的顺序。
+    """
+
+    def __init__(self, app: "MCPClientGUI", session_id: str, title: str):
+        self.app = app
+        self.session_id = session_id
+        self.title = title
+        self.busy = False  # 查询进行中（直到其协程真正结束才复位）
+        self.future = None  # 进行中的查询（concurrent.futures.Future），用于取消
+        self.archive_path: Optional[str] = None
+
+        self.frame = tk.Frame(app.notebook)
+
+        # 聊天显示区域
+        self.chat_display = scrolledtext.ScrolledText(self.frame, state='disabled', wrap=tk.WORD)
+        self.chat_display.pack(pady=(10, 5), padx=10, expand=True, fill=tk.BOTH)
+        self.chat_display.tag_config("user", foreground="blue", font=('Arial', 10, 'bold'))
+        self.chat_display.tag_config("sender", foreground="green", font=('Arial', 10, 'bold'))
+        self.chat_display.tag_config("system", foreground="gray", font=('Arial', 9, 'italic'))
+
+        # 消息输入区域
+        self.input_frame = tk.Frame(self.frame)
+        self.input_frame.pack(pady=5, fill=tk.X)
+
+        self.message_entry = tk.Entry(self.input_frame)
+        self.message_entry.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        self.message_entry.bind("<Return>", lambda event: app.send_message(self))
+
+        self.send_button = tk.Button(self.input_frame, text="发送", command=lambda: app.send_message(self))
+        self.send_button.pack(side=tk.LEFT, padx=5)
+
+        # 本对话的状态（本轮耗时分布）
+        self.status_label = tk.Label(self.frame, text="就绪", anchor=tk.W, fg="gray")
+        self.status_label.pack(padx=10, pady=(0, 5), fill=tk.X)
+
+        app.notebook.add(self.frame, text=title)
+
+    def set_busy(self, busy: bool):
+        """切换查询进行中的状态：禁用输入并在标签标题上标记"""
+        self.busy = busy
+        if not busy:
+            self.future = None
+        state = 'disabled' if busy else 'normal'
+        self.message_entry.config(state=state)
+        self.send_button.config(state=state)
+        self.app.notebook.tab(self.frame, text=f"{self.title} …" if busy else self.title)
+        if not busy and self.app.current_tab() is self:
+            self.message_entry.focus()
+
+    def set_status(self, message: str):
+        self.status_label.config(text=message)
+
+    def insert_chunks(self, chunks: list):
+        """一次插入多段文本（文本与标签交替），超出保留行数时归档最早的内容"""
+        if not chunks:
+            return
+        self.chat_display.config(state='normal')
+        self.chat_display.insert(tk.END, *chunks)
+        self._trim_scrollback()
+        self.chat_display.config(state='disabled')
+        self.chat_display.see(tk.END)
+
+    def _trim_scrollback(self):
+        lines = int(self.chat_display.index("end-1c").split(".")[0])
+        if lines <= CHAT_MAX_LINES:
+            return
+        # 多删一成，避免之后每次插入都触发归档
+        cut = lines - CHAT_MAX_LINES + CHAT_MAX_LINES // 10
+        first_archive = self.archive_path is None
+        self._archive(self.chat_display.get("1.0", f"{cut + 1}.0"))
+        self.chat_display.delete("1.0", f"{cut + 1}.0")
+        if first_archive and self.archive_path:
+            self.set_status(f"更早的对话已归档到 {self.archive_path}")
+
+    def _archive(self, text: str):
+        """把移出聊天区域的内容追加写入本对话的归档文件"""
+        if not CHAT_ARCHIVE_DIR:
+            return
+        if self.archive_path is None:
+            self.archive_path = os.path.join(
+                CHAT_ARCHIVE_DIR, time.strftime(f"chat-%Y%m%d-%H%M%S-{self.session_id}.log")
+            )
+        try:
+            os.makedirs(CHAT_ARCHIVE_DIR, exist_ok=True)
+            with open(self.archive_path, "a", encoding="utf-8") as f:
+                f.write(text)
+        except OSError as e:
+            logger.error(f"写入聊天归档失败: {e}")
+
+    def destroy(self):
+        self.app.notebook.forget(self.frame)
+        self.frame.destroy()
+
+
 class MCPClientGUI:
+    """图形界面
+
+    Tk 在主线程运行自己的事件循环，asyncio 事件循环运行在后台线程中：
+    界面回调通过 run_coroutine_threadsafe 提交协程，协程中的界面更新经队列
+    交回主线程，由一个虚拟事件唤醒后批量执行。两边空闲时都不占用 CPU。
+
+    每个对话是一个标签页（ChatTab），以各自的 session_id 并发查询；
+    工具调用的并发名额由 MCPClient 在各会话之间轮流分配。
+    """
+
     def __init__(self, root):
         self.root = root
         self.client: Optional[MCPClient] = None
-        self.loop = asyncio.get_event_loop()
         self.running = False
-        
+        self.closing = False
+        # 预热的服务器连接池：重连时无需等待服务器进程冷启动
+        self.pool = ServerPool()
+
+        # 后台线程中的 asyncio 事件循环
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self._run_loop, name="asyncio-loop", daemon=True)
+        self.loop_thread.start()
+
+        # 后台线程交给 Tk 主线程执行的界面更新
+        self._ui_queue: queue.Queue = queue.Queue()
+        self._wake_lock = threading.Lock()
+        self._wake_pending = False
+
+        # 对话标签页：session_id -> ChatTab
+        self.tabs: dict = {}
+        self._tab_count = 0
+
         self.setup_ui()
+        self.root.bind("<<AsyncUpdate>>", self._drain_ui_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        # 状态栏实时显示本轮对话的耗时分布
+        tracer.add_listener(self._on_span_end)
         
         # 检查并设置默认服务器路径
         self.set_default_server_path()
@@ -35,6 +173,8 @@ class MCPClientGUI:
             self.server_path_entry.delete(0, tk.END)
             self.server_path_entry.insert(0, DEFAULT_SERVER_PATH)
             self.append_message("系统", f"检测到默认服务器脚本: {DEFAULT_SERVER_PATH}")
+            # 在用户点击连接之前预热默认服务器
+            self.submit(self.pool.prewarm(DEFAULT_SERVER_PATH))
         else:
             self.append_message("系统", f"未找到默认服务器脚本: {DEFAULT_SERVER_PATH}")
 
@@ -47,7 +187,7 @@ class MCPClientGUI:
         self.connection_frame = tk.Frame(self.root)
         self.connection_frame.pack(pady=10, fill=tk.X)
         
-        self.server_path_label = tk.Label(self.connection_frame, text="服务器脚本路径:")
+        self.server_path_label = tk.Label(self.connection_frame, text="服务器脚本路径或网址(多个用;分隔):")
         self.server_path_label.pack(side=tk.LEFT, padx=5)
         
         self.server_path_entry = tk.Entry(self.connection_frame, width=50)
@@ -59,6 +199,9 @@ class MCPClientGUI:
         self.connect_button = tk.Button(self.connection_frame, text="连接", command=self.toggle_connection)
         self.connect_button.pack(side=tk.LEFT, padx=5)
         
+        self.refresh_tools_button = tk.Button(self.connection_frame, text="刷新工具", command=self.refresh_tools)
+        self.refresh_tools_button.pack(side=tk.LEFT, padx=5)
+        
         # API配置面板
         self.api_frame = tk.Frame(self.root)
         self.api_frame.pack(pady=5, fill=tk.X)
@@ -77,22 +220,20 @@ class MCPClientGUI:
         self.model_entry.pack(side=tk.LEFT, padx=5)
         self.model_entry.insert(0, os.getenv("API_MODEL_NAME", ""))
         
-        # 聊天显示区域
-        self.chat_display = scrolledtext.ScrolledText(self.root, state='disabled', wrap=tk.WORD)
-        self.chat_display.pack(pady=10, padx=10, expand=True, fill=tk.BOTH)
-        
-        # 消息输入区域
-        self.input_frame = tk.Frame(self.root)
-        self.input_frame.pack(pady=10, fill=tk.X)
-        
-        self.message_entry = tk.Entry(self.input_frame)
-        self.message_entry.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
-        self.message_entry.bind("<Return>", self.send_message)
-        
-        self.send_button = tk.Button(self.input_frame, text="发送", command=self.send_message)
-        self.send_button.pack(side=tk.LEFT, padx=5)
-        
-        # 状态栏
+        self.close_tab_button = tk.Button(self.api_frame, text="关闭对话", command=self.close_tab)
+        self.close_tab_button.pack(side=tk.RIGHT, padx=5)
+
+        self.new_tab_button = tk.Button(self.api_frame, text="新对话", command=self.new_tab)
+        self.new_tab_button.pack(side=tk.RIGHT, padx=5)
+
+        # 对话标签页
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(pady=5, padx=5, expand=True, fill=tk.BOTH)
+        self.new_tab()
+        self.root.bind("<Control-t>", lambda event: self.new_tab())
+        self.root.bind("<Control-w>", lambda event: self.close_tab())
+
+        # 状态栏（连接状态）
         self.status_bar = tk.Label(self.root, text="就绪", bd=1, relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
@@ -108,132 +249,323 @@ class MCPClientGUI:
             self.server_path_entry.delete(0, tk.END)
             self.server_path_entry.insert(0, filepath)
     
+    def new_tab(self) -> ChatTab:
+        """新建一个对话标签页（独立的会话历史）并切换过去"""
+        self._tab_count += 1
+        tab = ChatTab(self, f"tab-{self._tab_count}", f"对话 {self._tab_count}")
+        self.tabs[tab.session_id] = tab
+        self.notebook.select(tab.frame)
+        tab.message_entry.focus()
+        return tab
+
+    def close_tab(self):
+        """关闭当前对话：取消进行中的查询并丢弃其历史；至少保留一个标签页"""
+        tab = self.current_tab()
+        if tab is None:
+            return
+        if tab.future is not None:
+            tab.future.cancel()
+        client = self.client
+        if client is not None:
+            self.loop.call_soon_threadsafe(client.reset_conversation, tab.session_id)
+        del self.tabs[tab.session_id]
+        tab.destroy()
+        if not self.tabs:
+            self.new_tab()
+
+    def current_tab(self) -> Optional[ChatTab]:
+        selected = self.notebook.select()
+        for tab in self.tabs.values():
+            if str(tab.frame) == selected:
+                return tab
+        return None
+
+    def _cancel_queries(self):
+        """取消所有标签页中进行中的查询（断开连接或关闭窗口前调用）"""
+        for tab in self.tabs.values():
+            if tab.future is not None:
+                tab.future.cancel()
+
     def toggle_connection(self):
         """切换连接状态"""
         if self.running:
-            self.loop.create_task(self.disconnect())
-        else:
-            self.loop.create_task(self.connect())
-    
-    async def connect(self):
-        """连接到服务器"""
+            self._cancel_queries()
+            self.submit(self.disconnect())
+            return
+
         server_path = self.server_path_entry.get().strip()
-        if not server_path:
+        # 多个服务器脚本路径用 ; 分隔
+        server_paths = [path.strip() for path in server_path.split(";") if path.strip()]
+        if not server_paths:
             messagebox.showerror("错误", "请输入服务器脚本路径")
             return
-        
+
+        # 更新API配置
+        os.environ["DS_API_KEY"] = self.api_key_entry.get().strip()
+        os.environ["DS_API_BASE"] = self.api_base_entry.get().strip()
+        os.environ["API_MODEL_NAME"] = self.model_entry.get().strip()
+        self.submit(self.connect(server_paths))
+
+    def refresh_tools(self):
+        """手动刷新工具列表"""
+        if self.client and self.running:
+            self.submit(self._refresh_tools())
+    
+    async def _refresh_tools(self):
+        """异步刷新工具列表并显示缓存统计"""
         try:
-            # 更新API配置
-            os.environ["DS_API_KEY"] = self.api_key_entry.get().strip()
-            os.environ["DS_API_BASE"] = self.api_base_entry.get().strip()
-            os.environ["API_MODEL_NAME"] = self.model_entry.get().strip()
-            
-            self.client = MCPClient()
-            await self.client.connect(server_path)
-            
+            tools = await self.client.refresh_tools()
+            stats = self.client.tool_cache_stats
+            self.append_message("系统", f"工具列表已刷新，共 {len(tools)} 个工具")
+            self.update_status(f"工具缓存: 命中 {stats['hits']} 次，刷新 {stats['refreshes']} 次")
+        except Exception as e:
+            self.append_message("系统", f"刷新工具列表失败: {str(e)}")
+            logger.error(f"刷新工具列表失败: {e}")
+    
+    async def connect(self, server_paths: list):
+        """连接到服务器"""
+        server_path = ";".join(server_paths)
+        try:
+            self.client = MCPClient(pool=self.pool)
+            await self.client.connect(*server_paths)
+
             self.running = True
-            self.connect_button.config(text="断开")
-            self.server_path_entry.config(state='disabled')
-            self.browse_button.config(state='disabled')
-            self.api_key_entry.config(state='disabled')
-            self.api_base_entry.config(state='disabled')
-            self.model_entry.config(state='disabled')
-            
-            self.append_message("系统", f"已连接到服务器: {server_path}")
+            self.call_ui(self._set_connected, True)
+            self.append_message(
+                "系统", f"已连接到服务器: {server_path}（耗时 {self.client.connect_time * 1000:.0f} ms）"
+            )
             self.update_status("已连接")
-            
+
         except Exception as e:
-            messagebox.showerror("连接错误", f"连接失败: {str(e)}")
+            # 释放连接失败时已创建的连接池等资源
+            if self.client:
+                await self.client.cleanup()
+                self.client = None
+            self.call_ui(messagebox.showerror, "连接错误", f"连接失败: {str(e)}")
             self.update_status(f"连接失败: {str(e)}")
-    
+
     async def disconnect(self):
         """断开服务器连接"""
         try:
             if self.client:
                 await self.client.cleanup()
                 self.client = None
-            
+
             self.running = False
-            self.connect_button.config(text="连接")
-            self.server_path_entry.config(state='normal')
-            self.browse_button.config(state='normal')
-            self.api_key_entry.config(state='normal')
-            self.api_base_entry.config(state='normal')
-            self.model_entry.config(state='normal')
-            
+            self.call_ui(self._set_connected, False)
             self.append_message("系统", "已断开服务器连接")
             self.update_status("已断开连接")
-            
+
         except Exception as e:
-            messagebox.showerror("断开错误", f"断开连接失败: {str(e)}")
+            self.call_ui(messagebox.showerror, "断开错误", f"断开连接失败: {str(e)}")
             self.update_status(f"断开失败: {str(e)}")
-    
-    def send_message(self, event=None):
-        """发送消息"""
-        message = self.message_entry.get().strip()
-        if message and self.client and self.running:
-            self.loop.create_task(self._send_query(message))
-            self.message_entry.delete(0, tk.END)
-    
-    async def _send_query(self, user_input: str):
-        """异步发送查询并处理响应"""
+
+    def _set_connected(self, connected: bool):
+        """按连接状态切换按钮文字和配置输入框的可用状态"""
+        state = 'disabled' if connected else 'normal'
+        self.connect_button.config(text="断开" if connected else "连接")
+        for widget in (
+            self.server_path_entry, self.browse_button, self.api_key_entry, self.api_base_entry, self.model_entry
+        ):
+            widget.config(state=state)
+
+    def send_message(self, tab: ChatTab):
+        """在指定标签页发送消息；其他标签页的查询不受影响"""
+        message = tab.message_entry.get().strip()
+        if message and self.client and self.running and not tab.busy:
+            # 禁用本标签页的输入区域防止重复发送
+            tab.message_entry.delete(0, tk.END)
+            tab.set_busy(True)
+            tab.future = self.submit(self._send_query(self.client, tab.session_id, message))
+
+    async def _send_query(self, client: MCPClient, session_id: str, user_input: str):
+        """异步发送查询并把回复渲染到对应的标签页"""
         try:
-            self.append_message("你", user_input)
-            self.update_status("处理中...")
-            
-            # 禁用输入区域防止重复发送
-            self.message_entry.config(state='disabled')
-            self.send_button.config(state='disabled')
-            
-            response = await self.client.query(user_input)
-            self.append_message("助手", response)
-            
-            self.update_status("就绪")
-            
+            self.append_message("你", user_input, session_id)
+            self.update_tab_status(session_id, "处理中...")
+
+            # 逐段渲染流式回复（后台线程只入队，主线程批量插入）
+            self.begin_message("助手", session_id)
+            async for chunk in client.query_stream(user_input, session_id):
+                self.append_text(chunk, session_id)
+            self.append_text("\n\n", session_id)
+
+        except asyncio.CancelledError:
+            self.append_message("系统", "查询已取消", session_id)
+            self.update_tab_status(session_id, "已取消")
+            raise
+
         except Exception as e:
-            self.append_message("系统", f"处理查询时出错: {str(e)}")
-            self.update_status(f"错误: {str(e)}")
+            self.append_message("系统", f"处理查询时出错: {str(e)}", session_id)
+            self.update_tab_status(session_id, f"错误: {str(e)}")
             logger.error(f"处理查询时出错: {e}")
-            
+
         finally:
-            # 重新启用输入区域
-            self.message_entry.config(state='normal')
-            self.send_button.config(state='normal')
-            self.message_entry.focus()
-    
-    def append_message(self, sender: str, message: str):
+            # 协程真正结束（对话历史已收尾）后才重新启用输入区域
+            self.call_ui(self._finish_query, session_id)
+
+    def _finish_query(self, session_id: str):
+        tab = self.tabs.get(session_id)
+        if tab is not None:
+            tab.set_busy(False)
+
+    # ---- asyncio 线程与 Tk 主线程之间的桥接 ----
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """把协程提交到后台事件循环，返回 concurrent.futures.Future"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._log_task_error)
+        return future
+
+    @staticmethod
+    def _log_task_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"后台任务出错: {future.exception()}")
+
+    def call_ui(self, func, *args):
+        """在 Tk 主线程中执行 func(*args)，可从任意线程调用"""
+        self._post(("call", func, args))
+
+    def _post(self, item: tuple):
+        self._ui_queue.put(item)
+        with self._wake_lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        # 每批更新只唤醒一次主线程；窗口已销毁时直接忽略
+        try:
+            self.root.event_generate("<<AsyncUpdate>>", when="tail")
+        except (RuntimeError, tk.TclError):
+            # 主循环尚未启动或已退出：留待 run() 启动时的首次清空处理
+            with self._wake_lock:
+                self._wake_pending = False
+
+    def _drain_ui_queue(self, event=None):
+        """在主线程中执行队列中的全部界面更新，同一标签页连续的文本合并为一次插入"""
+        with self._wake_lock:
+            self._wake_pending = False
+        session_id, chunks = None, []
+        while True:
+            try:
+                item = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] == "text" and (not chunks or item[1] == session_id):
+                session_id = item[1]
+                chunks.extend(item[2:])
+                continue
+            self._insert_chunks(session_id, chunks)
+            session_id, chunks = None, []
+            if item[0] == "text":
+                session_id = item[1]
+                chunks.extend(item[2:])
+                continue
+            _, func, args = item
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"界面更新出错: {e}")
+        self._insert_chunks(session_id, chunks)
+
+    # ---- 聊天区域 ----
+    # session_id 为 None 的消息（连接状态等系统消息）显示在当前标签页
+
+    def append_message(self, sender: str, message: str, session_id: Optional[str] = None):
         """在聊天区域添加消息"""
-        self.chat_display.config(state='normal')
-        
-        # 添加发送者标签
-        self.chat_display.insert(tk.END, f"{sender}: ", "sender" if sender != "你" else "user")
-        
-        # 添加消息内容
-        self.chat_display.insert(tk.END, f"{message}\n\n")
-        
-        self.chat_display.config(state='disabled')
-        self.chat_display.see(tk.END)
-    
+        self.begin_message(sender, session_id)
+        self.append_text(f"{message}\n\n", session_id)
+
+    def begin_message(self, sender: str, session_id: Optional[str] = None):
+        """在聊天区域开始一条新消息（写入发送者标签）"""
+        self._post(("text", session_id, f"{sender}: ", "sender" if sender != "你" else "user"))
+
+    def append_text(self, text: str, session_id: Optional[str] = None):
+        """向当前消息末尾追加文本"""
+        self._post(("text", session_id, text, ()))
+
+    def _insert_chunks(self, session_id: Optional[str], chunks: list):
+        tab = self.tabs.get(session_id) if session_id is not None else self.current_tab()
+        # 标签页已关闭时丢弃
+        if tab is not None:
+            tab.insert_chunks(chunks)
+
+    def _on_span_end(self, span):
+        """模型调用或工具调用结束时刷新对应标签页的本轮耗时分布（在事件循环线程中调用）"""
+        if span.root.name != "turn":
+            return
+        prefix = "就绪" if span.root is span else "处理中..."
+        self.update_tab_status(span.root.attrs.get("session"), f"{prefix} | {span.root.summary()}")
+
+    def update_tab_status(self, session_id: str, message: str):
+        """更新标签页的状态栏，可从任意线程调用"""
+        self.call_ui(self._set_tab_status, session_id, message)
+
+    def _set_tab_status(self, session_id: str, message: str):
+        tab = self.tabs.get(session_id)
+        if tab is not None:
+            tab.set_status(message)
+
     def update_status(self, message: str):
-        """更新状态栏"""
-        self.status_bar.config(text=message)
-    
+        """更新状态栏，可从任意线程调用"""
+        self.call_ui(self.status_bar.config, {"text": message})
+
+    # ---- 生命周期 ----
+
+    async def _shutdown(self):
+        try:
+            if self.client:
+                await self.client.cleanup()
+                self.client = None
+            await self.pool.aclose()
+        except Exception as e:
+            logger.error(f"关闭时释放资源出错: {e}")
+
+    def close(self):
+        """关闭窗口：先在后台释放连接和服务器进程，完成后销毁窗口"""
+        if self.closing:
+            return
+        self.closing = True
+        self.update_status("正在关闭...")
+        self._cancel_queries()
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        future.add_done_callback(lambda _: self.call_ui(self.root.destroy))
+
     def run(self):
         """运行GUI主循环"""
-        # 配置文本标签样式
-        self.chat_display.tag_config("user", foreground="blue", font=('Arial', 10, 'bold'))
-        self.chat_display.tag_config("sender", foreground="green", font=('Arial', 10, 'bold'))
-        self.chat_display.tag_config("system", foreground="gray", font=('Arial', 9, 'italic'))
-        
-        async def run_async():
-            while True:
-                self.root.update()
-                await asyncio.sleep(0.05)
-        
-        self.loop.run_until_complete(run_async())
+        self.root.after_idle(self._drain_ui_queue)
+        try:
+            self.root.mainloop()
+        finally:
+            tracer.remove_listener(self._on_span_end)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join(timeout=5)
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="MCP 客户端：无参数时启动图形界面")
+    parser.add_argument("servers", nargs="*", help="服务器脚本路径或网址，给出时使用命令行交互")
+    parser.add_argument("--batch", metavar="INPUT", help="批量模式：从 JSONL 文件读取查询")
+    parser.add_argument("--output", metavar="OUTPUT", help="批量模式的结果文件（默认 <INPUT>.results.jsonl）")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="批量模式同时进行的对话数")
+    return parser.parse_args()
 
 def main():
-    if len(sys.argv) < 2:
+    args = parse_args()
+    if args.batch:
+        # 批量模式：并发执行 JSONL 中的查询，支持断点续跑
+        async def batch_main():
+            output = args.output or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+            async with MCPClient(max_connections=max(args.concurrency, API_MAX_CONNECTIONS)) as client:
+                await client.connect(*(args.servers or [DEFAULT_SERVER_PATH]))
+                summary = await run_batch(client, args.batch, output, args.concurrency)
+            print(f"批量查询完成: {summary}，结果已写入 {output}")
+        
+        asyncio.run(batch_main())
+    elif not args.servers:
         root = tk.Tk()
         app = MCPClientGUI(root)
         app.run()
@@ -241,7 +573,7 @@ def main():
         # 保留原有的命令行功能
         async def cli_main():
             async with MCPClient() as client:
-                await client.connect(sys.argv[1])
+                await client.connect(*args.servers)
                 await client.interactive_chat()
         
         asyncio.run(cli_main())
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+from typing import Optional
+
+# 对话记忆配置
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))  # 历史上下文的估算 token 上限
+TOOL_OUTPUT_KEEP_CHARS = int(os.getenv("TOOL_OUTPUT_KEEP_CHARS", "300"))  # 旧轮次工具输出保留的字符数
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "2000"))  # 早期对话摘要的最大字符数
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: dict) -> int:
+    """估算一条消息占用的 token 数（含角色等固定开销）"""
+    tokens = 4 + estimate_tokens(message.get("content") or "")
+    for call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(json.dumps(call["function"], ensure_ascii=False))
+    return tokens
+
+
+class Turn:
+    """一轮对话：一条用户消息及其后的助手/工具消息"""
+
+    def __init__(self, user_message: dict, question: str):
+        self.question = question
+        self.messages = [user_message]
+        self.tokens = [message_tokens(user_message)]
+        self.compacted = False
+
+    def append(self, message: dict) -> None:
+        self.messages.append(message)
+        self.tokens.append(message_tokens(message))
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    @property
+    def answer(self) -> str:
+        """本轮最后一条助手回复"""
+        for message in reversed(self.messages):
+            if message["role"] == "assistant" and message.get("content"):
+                return message["content"]
+        return ""
+
+    def tool_names(self) -> list:
+        names = []
+        for message in self.messages:
+            for call in message.get("tool_calls") or []:
+                names.append(call["function"]["name"])
+        return names
+
+    def truncate_tool_outputs(self, keep_chars: int) -> None:
+        """截断本轮的工具输出，只保留开头部分"""
+        for i, message in enumerate(self.messages):
+            content = message.get("content") or ""
+            if message["role"] == "tool" and len(content) > keep_chars:
+                self.messages[i] = {**message, "content": content[:keep_chars] + "...(已截断)"}
+                self.tokens[i] = message_tokens(self.messages[i])
+        self.compacted = True
+
+
+class Conversation:
+    """单个会话的历史记录，按 token 预算压缩
+
+    压缩分两步：先截断旧轮次的工具输出，仍超出预算时把最早的轮次
+    折叠进摘要（保留问题、回答要点和用过的工具）。
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET):
+        self.budget = budget
+        self.turns: list = []
+        self.summary = ""
+
+    def start_turn(self, user_message: dict, question: Optional[str] = None) -> None:
+        """开始新一轮对话"""
+        self.turns.append(Turn(user_message, question or user_message["content"]))
+
+    def append(self, message: dict) -> None:
+        """向当前轮次追加消息"""
+        self.turns[-1].append(message)
+
+    def extend(self, messages: list) -> None:
+        for message in messages:
+            self.append(message)
+
+    def abort_turn(self) -> None:
+        """丢弃未完成的当前轮次，避免留下没有结果的工具调用"""
+        if self.turns:
+            self.turns.pop()
+
+    def messages(self) -> list:
+        """返回发送给模型的完整消息列表"""
+        result = []
+        if self.summary:
+            result.append({"role": "system", "content": f"之前的对话摘要:\n{self.summary}"})
+        for turn in self.turns:
+            result.extend(turn.messages)
+        return result
+
+    def token_count(self) -> int:
+        return estimate_tokens(self.summary) + sum(turn.total_tokens for turn in self.turns)
+
+    def compact(self) -> None:
+        """把历史压缩到 token 预算以内（当前轮次始终保留）"""
+        if self.token_count() <= self.budget:
+            return
+
+        for turn in self.turns[:-1]:
+            if not turn.compacted:
+                turn.truncate_tool_outputs(TOOL_OUTPUT_KEEP_CHARS)
+
+        while self.token_count() > self.budget and len(self.turns) > 1:
+            self._fold_into_summary(self.turns.pop(0))
+
+    def _fold_into_summary(self, turn: Turn) -> None:
+        """把一轮对话折叠成摘要中的一条记录"""
+        entry = f"- 用户: {turn.question[:200]}"
+        tools = turn.tool_names()
+        if tools:
+            entry += f"（调用工具: {', '.join(dict.fromkeys(tools))}）"
+        answer = turn.answer.replace("\n", " ")
+        if answer:
+            entry += f"\n  助手: {answer[:300]}"
+
+        summary = f"{self.summary}\n{entry}" if self.summary else entry
+        if len(summary) > SUMMARY_MAX_CHARS:
+            # 超长时丢弃最早的摘要记录
+            summary = summary[-SUMMARY_MAX_CHARS:]
+            summary = summary[summary.find("\n- ") + 1:] if "\n- " in summary else summary
+        self.summary = summary
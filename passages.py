@@ -0,0 +1,110 @@
+import math
+import re
+from collections import Counter
+
+# 段落切分配置
+PASSAGE_SIZE = 300  # 每个段落的目标字符数
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+
+
+def tokenize(text: str) -> list:
+    """分词：英文数字按单词切分，连续汉字按二元组切分（单字保留为一元）"""
+    tokens = []
+    for word in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def split_passages(text: str, size: int = PASSAGE_SIZE) -> list:
+    """按行把文本合并成约 size 个字符的段落，超长行会被硬切分"""
+    passages = []
+    current = []
+    length = 0
+    for line in text.split("\n"):
+        if current and length + len(line) > size:
+            passages.append("\n".join(current))
+            current, length = [], 0
+        while len(line) > size:
+            passages.append(line[:size])
+            line = line[size:]
+        if line:
+            current.append(line)
+            length += len(line) + 1
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+class BM25:
+    """轻量 BM25 词法索引"""
+
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = sum(self.lengths) / len(documents) if documents else 0.0
+
+        doc_freqs = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        n = len(documents)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()
+        }
+
+    def scores(self, query: list) -> list:
+        """返回每个文档对查询词的 BM25 得分"""
+        result = []
+        for freqs, length in zip(self.term_freqs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1))
+            for term in query:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            result.append(score)
+        return result
+
+
+def top_passages(text: str, query: str, budget: int, size: int = PASSAGE_SIZE) -> str:
+    """按与 query 的相关度挑选段落，总长度不超过 budget，按原文顺序拼接
+
+    query 为空或没有任何段落命中时返回文本开头部分。
+    """
+    if len(text) <= budget:
+        return text
+
+    query_tokens = list(dict.fromkeys(tokenize(query or "")))
+    passages = split_passages(text, size)
+    if not query_tokens or not passages:
+        return text[:budget]
+
+    index = BM25([tokenize(p) for p in passages])
+    scores = index.scores(query_tokens)
+    ranked = sorted(
+        (i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i]
+    )
+    if not ranked:
+        return text[:budget]
+
+    chosen = []
+    used = 0
+    for i in ranked:
+        cost = len(passages[i]) + 5
+        if used + cost > budget:
+            continue
+        chosen.append(i)
+        used += cost
+    if not chosen:
+        return passages[ranked[0]][:budget]
+
+    return "\n...\n".join(passages[i] for i in sorted(chosen))
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from cache import MemoryCache
+from tracing import tracer
+
+# 搜索结果预取配置
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", "0"))  # search_engine 返回后预取前几个结果，0 表示关闭
+PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "32"))  # 最多保留的预取网页数
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "300"))  # 预取结果的有效期（秒）
+
+
+class Prefetcher:
+    """在后台预先获取网页正文，供随后的 search_url 直接使用
+
+    每个网址对应一个后台任务，存放在有容量和有效期上限的 LRU 缓存中。
+    被取用算作命中；被淘汰、过期或服务器退出时仍未取用的算作浪费，
+    已完成的按提取出的文本字节数计入浪费字节数，未完成的直接取消。
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[str]],
+        size: int = PREFETCH_CACHE_SIZE,
+        ttl: float = PREFETCH_TTL,
+    ):
+        self.fetch = fetch
+        self.entries = MemoryCache(size, ttl, on_evict=self._discard)
+        self.stats = {"started": 0, "hits": 0, "wasted": 0, "wasted_bytes": 0}
+        self._running: set = set()  # 尚未结束的后台任务，退出时等待其取消完成
+
+    def prefetch(self, urls: list) -> None:
+        """为尚未预取的网址启动后台获取"""
+        for url in urls:
+            if url in self.entries:
+                continue
+            task = asyncio.create_task(self.fetch(url))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            self.entries.set(url, task)
+            self.stats["started"] += 1
+            tracer.metrics.inc("mcp_prefetch_total", 1, "预取结果数（按去向）", outcome="started")
+
+    async def get(self, url: str) -> Optional[str]:
+        """取出预取结果；没有预取或预取失败时返回 None，由调用方自行获取"""
+        task = self.entries.get(url)
+        if task is None:
+            return None
+        self.entries.pop(url)
+        try:
+            text = await task
+        except Exception as e:
+            logger.debug(f"预取 {url} 失败，改为直接获取: {e}")
+            return None
+
+        self.stats["hits"] += 1
+        tracer.metrics.inc("mcp_prefetch_total", 1, "预取结果数（按去向）", outcome="hit")
+        logger.debug(f"预取命中: {url}，统计: {self.stats}")
+        return text
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / self.stats["started"] if self.stats["started"] else 0.0
+
+    def _discard(self, url: str, task: asyncio.Task) -> None:
+        """未被取用的预取结果被丢弃时记入浪费"""
+        wasted_bytes = 0
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            wasted_bytes = len(task.result().encode("utf-8"))
+        self.stats["wasted"] += 1
+        self.stats["wasted_bytes"] += wasted_bytes
+        tracer.metrics.inc("mcp_prefetch_total", 1, "预取结果数（按去向）", outcome="wasted")
+        tracer.metrics.inc("mcp_prefetch_wasted_bytes_total", wasted_bytes, "未被使用的预取文本字节数")
+
+    async def aclose(self) -> None:
+        """取消未完成的预取并输出统计"""
+        self.entries.clear()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        logger.info(f"预取统计: {self.stats}，命中率 {self.hit_rate:.0%}")
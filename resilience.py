@@ -0,0 +1,304 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields, replace
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from loguru import logger
+
+from cache import MemoryCache
+from tracing import tracer
+
+# 重试配置
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))  # 最多尝试次数（含首次）
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # 退避基数（秒），按 2^n 增长并加随机抖动
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))  # 单次退避上限（秒）
+RETRY_AFTER_MAX = float(os.getenv("RETRY_AFTER_MAX", "30"))  # Retry-After 超过该值时不再重试（秒）
+
+# 对冲请求配置：首个请求超过近期 p95 延迟仍未返回时，再发一个相同请求，取先返回者
+HEDGE = os.getenv("HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.1"))  # 对冲延迟下限（秒）
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # 延迟样本不足时不对冲
+
+# 熔断配置
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # 连续失败多少次后熔断
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))  # 熔断后多久放行一次试探请求（秒）
+
+# 按端点类型（llm / web / tool）覆盖上述配置，例如 {"llm": {"hedge": true}, "tool": {"breaker_failures": 3}}
+RESILIENCE_POLICIES = json.loads(os.getenv("RESILIENCE_POLICIES", "{}"))
+
+# 保留状态（熔断器、延迟样本）的端点数，超出时淘汰最久未使用的端点
+RESILIENCE_MAX_ENDPOINTS = int(os.getenv("RESILIENCE_MAX_ENDPOINTS", "1024"))
+
+# 可重试的 HTTP 状态码
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """端点处于熔断状态，请求被直接拒绝"""
+
+
+@dataclass(frozen=True)
+class Policy:
+    """单个端点类型的容错策略"""
+    attempts: int = RETRY_ATTEMPTS
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+    retry_after_max: float = RETRY_AFTER_MAX
+    hedge: bool = HEDGE
+    hedge_percentile: float = HEDGE_PERCENTILE
+    hedge_min_delay: float = HEDGE_MIN_DELAY
+    hedge_min_samples: int = HEDGE_MIN_SAMPLES
+    breaker_failures: int = BREAKER_FAILURES
+    breaker_reset: float = BREAKER_RESET
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def policy_for(kind: str) -> Policy:
+    """返回端点类型的策略：环境变量默认值 + RESILIENCE_POLICIES 中的覆盖项"""
+    overrides = RESILIENCE_POLICIES.get(kind, {})
+    known = {f.name for f in fields(Policy)}
+    unknown = set(overrides) - known
+    if unknown:
+        logger.warning(f"忽略未知的容错配置项 {kind}: {sorted(unknown)}")
+    return replace(Policy(), **{k: v for k, v in overrides.items() if k in known})
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，冷却期过后放行一个试探请求（半开），成功则恢复"""
+
+    def __init__(self, name: str, kind: str, policy: Policy):
+        self.name = name
+        self.kind = kind
+        self.policy = policy
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"熔断器 {self.name}: {self.state} -> {state}")
+            self.state = state
+            tracer.metrics.inc(
+                "mcp_circuit_transitions_total", 1, "熔断器状态切换次数", endpoint=self.kind, state=state
+            )
+
+    def before_call(self) -> None:
+        """请求前检查，熔断中直接抛出 CircuitOpenError"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.policy.breaker_reset:
+                tracer.metrics.inc("mcp_circuit_rejected_total", 1, "熔断期间被拒绝的请求数", endpoint=self.kind)
+                raise CircuitOpenError(f"{self.name} 暂时不可用（熔断中）")
+            self._transition("half_open")
+        if self.state == "half_open":
+            if self._probing:
+                tracer.metrics.inc("mcp_circuit_rejected_total", 1, "熔断期间被拒绝的请求数", endpoint=self.kind)
+                raise CircuitOpenError(f"{self.name} 暂时不可用（等待试探请求结果）")
+            self._probing = True
+
+    def release(self) -> None:
+        """调用被取消等不计成败的情况：释放半开状态的试探名额"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._transition("closed")
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.policy.breaker_failures:
+            self.opened_at = time.monotonic()
+            self._transition("open")
+
+
+class Endpoint:
+    """一个上游端点：熔断器 + 近期延迟样本（用于计算对冲延迟）"""
+
+    def __init__(self, name: str, kind: str, policy: Policy):
+        self.name = name
+        self.kind = kind
+        self.policy = policy
+        self.breaker = CircuitBreaker(name, kind, policy)
+        self.latencies: deque = deque(maxlen=200)
+
+    def hedge_delay(self) -> Optional[float]:
+        """近期延迟的指定百分位，样本不足时返回 None（不对冲）"""
+        if not self.policy.hedge or len(self.latencies) < self.policy.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * self.policy.hedge_percentile / 100), len(ordered) - 1)
+        return max(ordered[index], self.policy.hedge_min_delay)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期）"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _discard(task: asyncio.Task) -> None:
+    """取消落败的请求，已返回的响应需要关闭以归还连接"""
+    task.cancel()
+    try:
+        response = await task
+    except BaseException:
+        return
+    await response.aclose()
+
+
+class Resilience:
+    """按端点管理重试、对冲与熔断，结果计入 tracer 的指标
+
+    端点按最近使用保留 max_endpoints 个（例如按主机区分的网页端点），
+    被淘汰的端点再次使用时从关闭状态重新开始。
+    """
+
+    def __init__(self, max_endpoints: int = RESILIENCE_MAX_ENDPOINTS):
+        self.endpoints = MemoryCache(max_endpoints)
+
+    def endpoint(self, name: str, kind: str) -> Endpoint:
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            endpoint = Endpoint(name, kind, policy_for(kind))
+            self.endpoints.set(name, endpoint)
+        return endpoint
+
+    async def send(
+        self, name: str, kind: str, attempt: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """发送 HTTP 请求：可重试的状态码与传输错误按退避重试，必要时对冲
+
+        attempt 每次调用都应发起一个新请求。返回的响应由调用方检查状态码并关闭；
+        重试耗尽时返回最后一个响应或抛出最后一个异常。
+        """
+        endpoint = self.endpoint(name, kind)
+        policy = endpoint.policy
+        endpoint.breaker.before_call()
+
+        for number in range(policy.attempts):
+            last = number == policy.attempts - 1
+            try:
+                response = await self._hedged(endpoint, attempt)
+            except httpx.TransportError as e:
+                endpoint.breaker.record_failure()
+                self._count(kind, "error")
+                if last or endpoint.breaker.state == "open":
+                    raise
+                delay = policy.backoff(number)
+                logger.warning(f"{name} 请求失败（{type(e).__name__}），{delay:.2f}s 后重试")
+            except BaseException:
+                endpoint.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    endpoint.breaker.record_success()
+                    self._count(kind, "ok")
+                    return response
+
+                self._count(kind, "retryable_status")
+                if response.status_code >= 500:
+                    endpoint.breaker.record_failure()
+                else:
+                    endpoint.breaker.release()
+                retry_after = _retry_after(response)
+                if last or endpoint.breaker.state == "open" or (
+                    retry_after is not None and retry_after > policy.retry_after_max
+                ):
+                    return response
+                await response.aclose()
+                delay = retry_after if retry_after is not None else policy.backoff(number)
+                logger.warning(f"{name} 返回 {response.status_code}，{delay:.2f}s 后重试")
+
+            tracer.metrics.inc("mcp_resilience_retries_total", 1, "重试次数", endpoint=kind)
+            await asyncio.sleep(delay)
+            endpoint.breaker.before_call()
+
+    @staticmethod
+    def _count(kind: str, outcome: str) -> None:
+        tracer.metrics.inc("mcp_resilience_attempts_total", 1, "请求尝试次数（按结果）", endpoint=kind, outcome=outcome)
+
+    async def _timed(self, endpoint: Endpoint, attempt: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        started = time.perf_counter()
+        response = await attempt()
+        if response.status_code not in RETRY_STATUSES:
+            endpoint.latencies.append(time.perf_counter() - started)
+        return response
+
+    async def _hedged(self, endpoint: Endpoint, attempt: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """发出请求；超过对冲延迟仍未返回时再发一个，取先成功的响应"""
+        delay = endpoint.hedge_delay()
+        if delay is None:
+            return await self._timed(endpoint, attempt)
+
+        primary = asyncio.create_task(self._timed(endpoint, attempt))
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.append(asyncio.create_task(self._timed(endpoint, attempt)))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+                if winner is not None:
+                    break
+            if winner is None:
+                raise error
+            if len(tasks) > 1:
+                tracer.metrics.inc(
+                    "mcp_resilience_hedges_total", 1, "发出的对冲请求数（按胜出方）",
+                    endpoint=endpoint.kind, winner="hedge" if winner is tasks[1] else "primary",
+                )
+            return winner.result()
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    await _discard(task)
+
+    @asynccontextmanager
+    async def guard(self, name: str, kind: str):
+        """只做熔断保护（用于不宜重试的调用，例如工具调用）"""
+        breaker = self.endpoint(name, kind).breaker
+        breaker.before_call()
+        try:
+            yield
+        except Exception:
+            # 工具自身的错误以结果形式返回，抛出的异常说明超时或连接出了问题
+            breaker.record_failure()
+            self._count(kind, "error")
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            self._count(kind, "ok")
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Hashable
+
+
+class FairSemaphore:
+    """按 key 轮转分配名额的信号量
+
+    普通的 asyncio.Semaphore 按到达顺序放行：一个会话一次发出很多工具调用时，
+    其他会话的调用只能排在它们后面。这里每个 key（例如会话 ID）有自己的等待队列，
+    名额空出时在有等待者的 key 之间轮流分配，同一 key 内部仍按到达顺序。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: dict = {}  # key -> deque[Future]
+        self._order: deque = deque()  # 有等待者的 key，按轮转顺序排列
+
+    def locked(self) -> bool:
+        return self.active >= self.limit
+
+    def waiting(self, key: Hashable = None) -> int:
+        """等待中的请求数；给出 key 时只统计该 key"""
+        if key is not None:
+            return len(self._waiters.get(key, ()))
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def acquire(self, key: Hashable) -> None:
+        if self.active < self.limit and not self._order:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._waiters:
+            self._waiters[key] = deque()
+            self._order.append(key)
+        self._waiters[key].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分到名额但在恢复执行前被取消：把名额交给下一个等待者
+                self.release()
+            else:
+                self._remove(key, future)
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    def _remove(self, key: Hashable, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(key)
+        if waiters is None:
+            return
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            del self._waiters[key]
+            self._order.remove(key)
+
+    def _wake(self) -> None:
+        while self.active < self.limit and self._order:
+            key = self._order.popleft()
+            waiters = self._waiters[key]
+            future = waiters.popleft()
+            if waiters:
+                self._order.append(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                future.set_result(None)
+                self.active += 1
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        """占用一个名额直到退出上下文"""
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class TokenBucket:
+    """令牌桶限速：每秒补充 rate 个令牌，最多积攒 burst 个
+
+    令牌不足时预支，调用方按到达顺序依次等待，不会有请求一直抢不到令牌。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """取走一个令牌，返回拿到它之前需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay <= 0:
+            return
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # 没有用上的令牌还回去
+            self.tokens += 1
+            raise
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+from batch import iter_queries, load_done_ids, run_batch, run_query
+
+
+def write_jsonl(path, records: list) -> None:
+    path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records), encoding="utf-8")
+
+
+class FakeClient:
+    """记录每次查询使用的会话，查询期间让出事件循环以便并发交错"""
+
+    def __init__(self):
+        self.active_sessions = set()
+        self.overlaps = 0
+        self.sessions = []
+
+    async def query_stream(self, query, session_id, stats):
+        if session_id in self.active_sessions:
+            self.overlaps += 1
+        self.active_sessions.add(session_id)
+        self.sessions.append(session_id)
+        await asyncio.sleep(0.01)
+        stats.answer = f"answer to {query}"
+        yield stats.answer
+        self.active_sessions.discard(session_id)
+
+    def reset_conversation(self, session_id):
+        assert session_id not in self.active_sessions
+
+
+def test_duplicate_ids_are_made_unique(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    write_jsonl(path, [
+        {"id": "a", "query": "q1"},
+        {"request_id": "a", "body": "q2"},
+        {"prompt": "q3"},
+        {"id": "b"},
+    ])
+    assert list(iter_queries(str(path))) == [("a", "q1"), ("a@line-2", "q2"), ("line-3", "q3")]
+
+
+def test_same_id_queries_use_separate_sessions():
+    client = FakeClient()
+
+    async def run():
+        return await asyncio.gather(run_query(client, "a", "q1"), run_query(client, "a", "q2"))
+
+    records = asyncio.run(run())
+    assert client.overlaps == 0
+    assert len(set(client.sessions)) == 2
+    assert [record["response"] for record in records] == ["answer to q1", "answer to q2"]
+
+
+def test_resume_reruns_only_unfinished_duplicates(tmp_path):
+    queries = tmp_path / "queries.jsonl"
+    output = tmp_path / "results.jsonl"
+    write_jsonl(queries, [{"id": "a", "query": "q1"}, {"id": "a", "query": "q2"}])
+    write_jsonl(output, [{"id": "a", "error": None}])
+
+    client = FakeClient()
+    summary = asyncio.run(run_batch(client, str(queries), str(output), concurrency=2))
+    assert summary["skipped"] == 1
+    assert summary["completed"] == 1
+    assert load_done_ids(str(output)) == {"a", "a@line-2"}
@@ -0,0 +1,62 @@
+import sqlite3
+
+import cache
+from cache import DiskCache, MemoryCache
+
+
+def accessed_at(path: str, key: str) -> float:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT accessed_at FROM entries WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_disk_hits_are_written_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "ACCESS_FLUSH_SIZE", 3)
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCache(path)
+    for key in ("a", "b", "c"):
+        disk.set(key, b"value")
+    stored = accessed_at(path, "a")
+
+    assert disk.get("a").value == b"value"
+    assert disk.get("b").value == b"value"
+    # 命中只记在内存中，尚未写库
+    assert accessed_at(path, "a") == stored
+
+    disk.get("c")
+    assert accessed_at(path, "a") > stored
+    disk.close()
+
+
+def test_eviction_uses_pending_access_times(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCache(path, max_bytes=20)
+    disk.set("old", b"x" * 8)
+    disk.set("new", b"x" * 8)
+    # old 刚被读取过，写入第三个条目时应淘汰 new
+    disk.get("old")
+    disk.set("third", b"x" * 8)
+    assert disk.get("old") is not None
+    assert disk.get("new") is None
+    disk.close()
+
+
+def test_pending_access_times_are_written_on_close(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCache(path)
+    disk.set("a", b"value")
+    stored = accessed_at(path, "a")
+    disk.get("a")
+    disk.close()
+    assert accessed_at(path, "a") > stored
+
+
+def test_memory_cache_lru_and_eviction_callback():
+    evicted = []
+    memory = MemoryCache(2, on_evict=lambda key, value: evicted.append(key))
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+    assert evicted == ["b"]
+    assert "a" in memory and "c" in memory
+    assert len(memory) == 2
@@ -0,0 +1,22 @@
+from connections import ServerConnection, server_name
+
+
+def test_server_name():
+    assert server_name("tools.py") == "tools"
+    assert server_name("/srv/mcp/search_tools.py") == "search_tools"
+
+
+def test_server_config_is_forwarded_without_secrets(monkeypatch):
+    monkeypatch.setenv("SAVE_FILE_DIR", "/tmp/out")
+    monkeypatch.setenv("PREFETCH_TOP_K", "3")
+    monkeypatch.setenv("HTTP_CACHE_TTL", "60")
+    monkeypatch.setenv("DS_API_KEY", "secret")
+    monkeypatch.setenv("DS_API_BASE", "http://llm.test")
+
+    env = ServerConnection("tools.py", env={"PREFETCH_TOP_K": "5"})._server_params().env
+    assert env["SAVE_FILE_DIR"] == "/tmp/out"
+    assert env["HTTP_CACHE_TTL"] == "60"
+    # 显式传入的 env 优先于客户端环境
+    assert env["PREFETCH_TOP_K"] == "5"
+    assert "DS_API_KEY" not in env
+    assert "DS_API_BASE" not in env
@@ -0,0 +1,70 @@
+from memory import Conversation, estimate_tokens
+
+
+def tool_round(conversation: Conversation, question: str, output: str, answer: str) -> None:
+    conversation.start_turn({"role": "user", "content": question})
+    conversation.append({
+        "role": "assistant",
+        "content": "",
+        "tool_calls": [{"id": "1", "type": "function", "function": {"name": "search_url", "arguments": "{}"}}],
+    })
+    conversation.append({"role": "tool", "content": output, "tool_call_id": "1"})
+    conversation.append({"role": "assistant", "content": answer})
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_under_budget_is_untouched():
+    conversation = Conversation(budget=10000)
+    tool_round(conversation, "q1", "x" * 400, "a1")
+    before = conversation.messages()
+    conversation.compact()
+    assert conversation.messages() == before
+    assert conversation.summary == ""
+
+
+def test_old_tool_outputs_are_truncated_first():
+    conversation = Conversation(budget=600)
+    tool_round(conversation, "q1", "x" * 1200, "a1")
+    tool_round(conversation, "q2", "y" * 1200, "a2")
+    conversation.compact()
+
+    assert len(conversation.turns) == 2
+    old_output = conversation.turns[0].messages[2]["content"]
+    assert old_output.endswith("...(已截断)")
+    # 当前轮次始终保持原样
+    assert conversation.turns[1].messages[2]["content"] == "y" * 1200
+
+
+def test_oldest_turns_fold_into_summary():
+    conversation = Conversation(budget=120)
+    for n in range(4):
+        tool_round(conversation, f"问题{n}", "结果" * 200, f"回答{n}")
+    conversation.compact()
+
+    assert len(conversation.turns) >= 1
+    assert conversation.turns[-1].question == "问题3"
+    assert "问题0" in conversation.summary
+    assert "search_url" in conversation.summary
+    assert "回答0" in conversation.summary
+
+    messages = conversation.messages()
+    assert messages[0]["role"] == "system"
+    assert conversation.summary in messages[0]["content"]
+    # 保留下来的轮次中每个工具调用后面仍跟着对应的工具结果
+    for i, message in enumerate(messages):
+        if message.get("tool_calls"):
+            assert messages[i + 1]["role"] == "tool"
+
+
+def test_abort_turn_drops_the_current_turn():
+    conversation = Conversation()
+    tool_round(conversation, "q1", "out", "a1")
+    conversation.start_turn({"role": "user", "content": "q2"})
+    conversation.append({"role": "assistant", "content": "", "tool_calls": []})
+    conversation.abort_turn()
+    assert [turn.question for turn in conversation.turns] == ["q1"]
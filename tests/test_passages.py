@@ -0,0 +1,40 @@
+from passages import BM25, split_passages, tokenize, top_passages
+
+
+def test_tokenize_words_and_cjk_bigrams():
+    assert tokenize("Python 3.10 发布") == ["python", "3", "10", "发布"]
+    assert tokenize("机器学习") == ["机器", "器学", "学习"]
+    assert tokenize("猫") == ["猫"]
+
+
+def test_split_passages_respects_size():
+    text = "\n".join(["a" * 40] * 10) + "\n" + "b" * 250
+    passages = split_passages(text, size=100)
+    assert all(len(p) <= 100 for p in passages)
+    assert "".join(p.replace("\n", "") for p in passages) == text.replace("\n", "")
+
+
+def test_bm25_ranks_matching_document_first():
+    index = BM25([tokenize("天气 晴朗"), tokenize("python asyncio event loop"), tokenize("python 入门")])
+    scores = index.scores(tokenize("asyncio loop"))
+    assert scores[1] > 0
+    assert scores[0] == 0
+    assert scores.index(max(scores)) == 1
+
+
+def test_top_passages_keeps_relevant_passages_in_order():
+    filler = "无关内容" * 20
+    text = "\n".join([filler, "异步编程使用事件循环。", filler, "事件循环调度协程。", filler])
+    result = top_passages(text, "事件循环", budget=60, size=30)
+    assert "异步编程使用事件循环。" in result
+    assert "事件循环调度协程。" in result
+    assert result.index("异步编程") < result.index("调度协程")
+    assert filler[:30] not in result
+    assert len(result) <= 60
+
+
+def test_top_passages_falls_back_to_prefix():
+    text = "abcdef " * 100
+    assert top_passages(text, "", budget=50) == text[:50]
+    assert top_passages(text, "zzz", budget=50) == text[:50]
+    assert top_passages("short", "query", budget=50) == "short"
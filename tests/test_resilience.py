@@ -0,0 +1,185 @@
+import asyncio
+from dataclasses import replace
+
+import httpx
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, Endpoint, Policy, Resilience
+
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", "web", replace(Policy(), breaker_failures=3, breaker_reset=30))
+
+
+def expire(breaker: CircuitBreaker) -> None:
+    """让熔断冷却期立即结束"""
+    breaker.opened_at -= breaker.policy.breaker_reset
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = make_breaker()
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    expire(breaker)
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    expire(breaker)
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_probe_can_be_retried():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    expire(breaker)
+
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def make_resilience(**overrides) -> Resilience:
+    resilience = Resilience()
+    policy = replace(Policy(), **{"base_delay": 0, "hedge": False, **overrides})
+    resilience.endpoints.set("test", Endpoint("test", "web", policy))
+    return resilience
+
+
+def respond(*statuses, headers=None):
+    """依次返回给定状态码的 attempt 函数，同时记录调用次数"""
+    calls = []
+
+    async def attempt() -> httpx.Response:
+        status = statuses[min(len(calls), len(statuses) - 1)]
+        calls.append(status)
+        return httpx.Response(status, headers=headers)
+
+    return attempt, calls
+
+
+def test_send_retries_retryable_status():
+    resilience = make_resilience(attempts=3)
+    attempt, calls = respond(503, 503, 200)
+    response = asyncio.run(resilience.send("test", "web", attempt))
+    assert response.status_code == 200
+    assert calls == [503, 503, 200]
+    assert resilience.endpoint("test", "web").breaker.state == "closed"
+
+
+def test_send_returns_last_response_when_attempts_run_out():
+    resilience = make_resilience(attempts=2)
+    attempt, calls = respond(502)
+    response = asyncio.run(resilience.send("test", "web", attempt))
+    assert response.status_code == 502
+    assert len(calls) == 2
+
+
+def test_send_does_not_retry_client_errors():
+    resilience = make_resilience(attempts=3)
+    attempt, calls = respond(404)
+    response = asyncio.run(resilience.send("test", "web", attempt))
+    assert response.status_code == 404
+    assert calls == [404]
+
+
+def test_send_gives_up_on_long_retry_after():
+    resilience = make_resilience(attempts=3, retry_after_max=5)
+    attempt, calls = respond(429, headers={"Retry-After": "60"})
+    response = asyncio.run(resilience.send("test", "web", attempt))
+    assert response.status_code == 429
+    assert calls == [429]
+
+
+def test_send_stops_retrying_once_breaker_opens():
+    resilience = make_resilience(attempts=5, breaker_failures=2)
+    attempt, calls = respond(500)
+    response = asyncio.run(resilience.send("test", "web", attempt))
+    assert response.status_code == 500
+    assert len(calls) == 2
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.send("test", "web", attempt))
+
+
+def test_send_retries_transport_errors():
+    resilience = make_resilience(attempts=2)
+    calls = []
+
+    async def attempt() -> httpx.Response:
+        calls.append(None)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200)
+
+    response = asyncio.run(resilience.send("test", "web", attempt))
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+
+def test_hedge_takes_the_faster_response():
+    resilience = make_resilience(hedge=True, hedge_min_samples=1, hedge_min_delay=0.01)
+    resilience.endpoint("test", "web").latencies.append(0.01)
+    started = []
+
+    async def attempt() -> httpx.Response:
+        started.append(None)
+        if len(started) == 1:
+            await asyncio.sleep(5)
+            return httpx.Response(200, text="primary")
+        return httpx.Response(200, text="hedge")
+
+    async def run() -> httpx.Response:
+        return await asyncio.wait_for(resilience.send("test", "web", attempt), timeout=2)
+
+    response = asyncio.run(run())
+    assert response.text == "hedge"
+    assert len(started) == 2
+
+
+def test_endpoints_are_bounded():
+    resilience = Resilience(max_endpoints=2)
+    for name in ("a", "b", "c"):
+        resilience.endpoint(name, "web")
+    assert len(resilience.endpoints) == 2
+    assert resilience.endpoints.get("a") is None
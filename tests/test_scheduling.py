@@ -0,0 +1,143 @@
+import asyncio
+
+from scheduling import FairSemaphore, TokenBucket
+
+
+async def settle() -> None:
+    """让已就绪的任务都运行到下一个等待点"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_acquire_within_limit_does_not_wait():
+    async def run():
+        semaphore = FairSemaphore(2)
+        await semaphore.acquire("a")
+        await semaphore.acquire("b")
+        assert semaphore.locked()
+        semaphore.release()
+        assert not semaphore.locked()
+        assert semaphore.active == 1
+
+    asyncio.run(run())
+
+
+def test_free_slots_rotate_between_keys():
+    async def run():
+        semaphore = FairSemaphore(1)
+        await semaphore.acquire("holder")
+        order = []
+
+        async def worker(key: str, number: int):
+            async with semaphore.slot(key):
+                order.append(f"{key}{number}")
+
+        # a 先排入三个请求，b 之后才到，仍应与 a 轮流获得名额
+        tasks = [asyncio.create_task(worker("a", n)) for n in range(3)]
+        await settle()
+        tasks += [asyncio.create_task(worker("b", n)) for n in range(2)]
+        await settle()
+        assert semaphore.waiting() == 5
+        assert semaphore.waiting("a") == 3
+
+        semaphore.release()
+        await asyncio.gather(*tasks)
+        assert order == ["a0", "b0", "a1", "b1", "a2"]
+        assert semaphore.active == 0
+        assert semaphore.waiting() == 0
+
+    asyncio.run(run())
+
+
+def test_new_arrivals_queue_behind_waiters():
+    async def run():
+        semaphore = FairSemaphore(1)
+        await semaphore.acquire("a")
+        waiter = asyncio.create_task(semaphore.acquire("b"))
+        await settle()
+
+        # 名额刚释放就分给等待者，后来的 c 不能插队
+        semaphore.release()
+        late = asyncio.create_task(semaphore.acquire("c"))
+        await settle()
+        assert waiter.done()
+        assert not late.done()
+        assert semaphore.active == 1
+
+        semaphore.release()
+        await late
+        assert semaphore.active == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_is_removed():
+    async def run():
+        semaphore = FairSemaphore(1)
+        await semaphore.acquire("a")
+        waiter = asyncio.create_task(semaphore.acquire("b"))
+        await settle()
+        assert semaphore.waiting("b") == 1
+
+        waiter.cancel()
+        await settle()
+        assert waiter.cancelled()
+        assert semaphore.waiting() == 0
+
+        semaphore.release()
+        assert semaphore.active == 0
+
+    asyncio.run(run())
+
+
+def test_cancel_after_wake_hands_slot_to_next_waiter():
+    async def run():
+        semaphore = FairSemaphore(1)
+        await semaphore.acquire("a")
+        first = asyncio.create_task(semaphore.acquire("b"))
+        second = asyncio.create_task(semaphore.acquire("c"))
+        await settle()
+
+        # release 把名额分给 first，但 first 在恢复执行前被取消
+        semaphore.release()
+        first.cancel()
+        await settle()
+        assert first.cancelled()
+        assert second.done() and not second.cancelled()
+        assert semaphore.active == 1
+        assert semaphore.waiting() == 0
+
+        semaphore.release()
+        assert semaphore.active == 0
+
+    asyncio.run(run())
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, burst=2)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[:2] == [0.0, 0.0]
+    assert 0.09 < delays[2] <= 0.1
+    assert 0.19 < delays[3] <= 0.2
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=10, burst=1)
+    assert bucket.reserve() == 0.0
+    bucket.updated -= 0.5
+    assert bucket.reserve() == 0.0
+    assert bucket.tokens == 0.0
+
+
+def test_cancelled_token_bucket_wait_returns_the_token():
+    async def run():
+        bucket = TokenBucket(rate=1, burst=1)
+        await bucket.acquire()
+        waiter = asyncio.create_task(bucket.acquire())
+        await settle()
+        waiter.cancel()
+        await settle()
+        return bucket
+
+    bucket = asyncio.run(run())
+    assert -0.01 < bucket.tokens <= 0.01
@@ -0,0 +1,197 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from client import MCPClient, QueryStats
+
+TOOLS = [{
+    "type": "function",
+    "function": {"name": "search_engine", "description": "", "parameters": {"type": "object", "properties": {}}},
+}]
+
+
+def sse(chunks: list) -> list:
+    """把分块转换成 SSE 数据行（每个分块一个 data 事件）"""
+    return [f"data: {json.dumps(chunk)}\n\n".encode() for chunk in chunks] + [b"data: [DONE]\n\n"]
+
+
+def text_delta(content: str) -> dict:
+    return {"choices": [{"index": 0, "delta": {"content": content}}]}
+
+
+def call_delta(index: int, arguments: str, call_id: str = "", name: str = "") -> dict:
+    tool_delta = {"index": index, "function": {"arguments": arguments}}
+    if call_id:
+        tool_delta["id"] = call_id
+        tool_delta["type"] = "function"
+        tool_delta["function"]["name"] = name
+    return {"choices": [{"index": 0, "delta": {"tool_calls": [tool_delta]}}]}
+
+
+def finish(reason: str) -> dict:
+    return {"choices": [{"index": 0, "delta": {}, "finish_reason": reason}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("DS_API_KEY", "test-key")
+    monkeypatch.setenv("DS_API_BASE", "http://llm.test/v1")
+    monkeypatch.setenv("API_MODEL_NAME", "test-model")
+    return MCPClient(llm_cache="off")
+
+
+def serve(client: MCPClient, *responses: list) -> list:
+    """让客户端依次收到给定的流式响应；返回的列表记录每个请求体和已发出的分块数"""
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        record = {"payload": json.loads(request.content), "sent": 0}
+        requests.append(record)
+
+        async def body():
+            for data in sse(responses[len(requests) - 1]):
+                record["sent"] += 1
+                yield data
+
+        return httpx.Response(200, content=body(), headers={"Content-Type": "text/event-stream"})
+
+    client.http = httpx.AsyncClient(base_url="http://llm.test/v1", transport=httpx.MockTransport(handler))
+    return requests
+
+
+def collect(client: MCPClient, requests: list) -> list:
+    """收集 _stream_api 的事件，工具调用附带产出时服务端已发出的分块数"""
+    async def run():
+        events = []
+        async for kind, data in client._stream_api([{"role": "user", "content": "hi"}], TOOLS):
+            events.append((kind, json.loads(json.dumps(data)), requests[-1]["sent"]))
+        return events
+
+    return asyncio.run(run())
+
+
+def test_split_argument_deltas_are_joined(client):
+    requests = serve(client, [
+        call_delta(0, "", "call_0", "search_engine"),
+        call_delta(0, '{"query": '),
+        call_delta(0, '"a"}'),
+        call_delta(1, '{"query"', "call_1", "search_engine"),
+        call_delta(1, ': "b"}'),
+        finish("tool_calls"),
+    ])
+    events = collect(client, requests)
+
+    calls = [(data, sent) for kind, data, sent in events if kind == "tool_call"]
+    assert [call["id"] for call, _ in calls] == ["call_0", "call_1"]
+    assert [json.loads(call["function"]["arguments"]) for call, _ in calls] == [{"query": "a"}, {"query": "b"}]
+    assert all(call["function"]["name"] == "search_engine" for call, _ in calls)
+    # 第一个调用在第二个调用开始时就已产出，不等到流结束
+    assert calls[0][1] == 4
+    assert calls[1][1] == 6
+
+    kind, message, _ = events[-1]
+    assert kind == "message"
+    assert message["content"] == ""
+    assert [call["id"] for call in message["tool_calls"]] == ["call_0", "call_1"]
+
+
+def test_interleaved_deltas_wait_for_complete_arguments(client):
+    requests = serve(client, [
+        call_delta(0, '{"qu', "call_0", "search_engine"),
+        call_delta(1, '{"qu', "call_1", "search_engine"),
+        call_delta(0, 'ery": "a"}'),
+        call_delta(1, 'ery": "b"}'),
+        finish("tool_calls"),
+    ])
+    events = collect(client, requests)
+
+    calls = [(data, sent) for kind, data, sent in events if kind == "tool_call"]
+    assert [call["id"] for call, _ in calls] == ["call_0", "call_1"]
+    assert [json.loads(call["function"]["arguments"]) for call, _ in calls] == [{"query": "a"}, {"query": "b"}]
+    # 调用 0 的参数在第三个分块才完整，之前出现的新序号不能让它提前产出
+    assert calls[0][1] == 4
+
+
+def test_text_and_calls_in_one_message(client):
+    requests = serve(client, [
+        text_delta("让我"),
+        text_delta("搜索一下"),
+        call_delta(0, '{"query": "a"}', "call_0", "search_engine"),
+        finish("tool_calls"),
+    ])
+    events = collect(client, requests)
+
+    assert [data for kind, data, _ in events if kind == "text"] == ["让我", "搜索一下"]
+    assert [kind for kind, _, _ in events] == ["text", "text", "tool_call", "message"]
+    message = events[-1][1]
+    assert message["content"] == "让我搜索一下"
+    assert message["tool_calls"][0]["function"]["arguments"] == '{"query": "a"}'
+    assert requests[0]["payload"]["stream"] is True
+
+
+def test_query_returns_only_the_final_answer(client):
+    requests = serve(
+        client,
+        [
+            text_delta("让我搜索一下"),
+            call_delta(0, '{"query": "a"}', "call_0", "search_engine"),
+            finish("tool_calls"),
+        ],
+        [text_delta("答案"), finish("stop")],
+    )
+    client.available_tools = TOOLS
+    client._tools_stale = False
+
+    async def run_tool_call(call, parent=None, session_id="default"):
+        return {"role": "tool", "content": "结果", "tool_call_id": call["id"]}
+
+    client._run_tool_call = run_tool_call
+
+    async def run():
+        stats = QueryStats()
+        chunks = [chunk async for chunk in client.query_stream("问题", stats=stats)]
+        return chunks, stats
+
+    chunks, stats = asyncio.run(run())
+    assert "".join(chunks) == "让我搜索一下\n\n答案"
+    assert stats.answer == "答案"
+    assert stats.tool_calls == 1
+
+    second = requests[1]["payload"]["messages"]
+    assert second[-1] == {"role": "tool", "content": "结果", "tool_call_id": "call_0"}
+    assert second[-2]["tool_calls"][0]["id"] == "call_0"
+
+
+def test_tool_results_follow_call_order(client):
+    # 调用 0 的参数最后才完整，调用 1 先开始执行
+    serve(
+        client,
+        [
+            call_delta(0, '{"qu', "call_0", "search_engine"),
+            call_delta(1, '{"query": "b"}', "call_1", "search_engine"),
+            call_delta(2, '{"query": "c"}', "call_2", "search_engine"),
+            call_delta(0, 'ery": "a"}'),
+            finish("tool_calls"),
+        ],
+        [text_delta("答案"), finish("stop")],
+    )
+    client.available_tools = TOOLS
+    client._tools_stale = False
+    started = []
+
+    async def run_tool_call(call, parent=None, session_id="default"):
+        started.append(call["id"])
+        return {"role": "tool", "content": "结果", "tool_call_id": call["id"]}
+
+    client._run_tool_call = run_tool_call
+
+    assert asyncio.run(client.query("问题")) == "答案"
+    assert started == ["call_1", "call_0", "call_2"]
+
+    messages = client.conversation().messages()
+    assistant = next(message for message in messages if message.get("tool_calls"))
+    tool_ids = [message["tool_call_id"] for message in messages if message["role"] == "tool"]
+    assert [call["id"] for call in assistant["tool_calls"]] == ["call_0", "call_1", "call_2"]
+    assert tool_ids == ["call_0", "call_1", "call_2"]
@@ -0,0 +1,118 @@
+import json
+import os
+import re
+from typing import Any
+
+from mcp import types
+
+from memory import estimate_tokens
+
+# 工具结果预算（估算 token 数，中文约 1 字 1 token）
+# 单个结果的上限不应小于 tools.py 中最大的字符预算（SEARCH_URLS_MAX_CHARS），否则中文结果会被再次截短
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "6500"))  # 单个工具结果的上限
+TOOL_TURN_MAX_TOKENS = int(os.getenv("TOOL_TURN_MAX_TOKENS", "16000"))  # 一轮对话中所有工具结果的上限
+TOOL_RESULT_MIN_TOKENS = int(os.getenv("TOOL_RESULT_MIN_TOKENS", "500"))  # 本轮剩余预算低于该值时不再提供工具
+
+# 分段结果（如 search_urls）中每段的标题行
+_SECTION_RE = re.compile(r"^=== .+ ===$", re.M)
+# 为每段截断说明预留的 token 数
+_MARKER_TOKENS = 16
+
+
+def _compact_json(text: str) -> str:
+    """文本是 JSON 时去掉缩进和多余空白，否则原样返回"""
+    stripped = text.strip()
+    if not stripped.startswith(("{", "[")):
+        return text
+    try:
+        value = json.loads(stripped)
+    except ValueError:
+        return text
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _part_text(part: Any) -> str:
+    """单个内容块的文本表示；二进制内容只保留简短说明"""
+    if isinstance(part, types.TextContent):
+        return _compact_json(part.text)
+    if isinstance(part, (types.ImageContent, types.AudioContent)):
+        kind = "图片" if isinstance(part, types.ImageContent) else "音频"
+        return f"[{kind}: {part.mimeType}, 约 {len(part.data) * 3 // 4} 字节]"
+    if isinstance(part, types.ResourceLink):
+        return f"[资源: {part.uri}]"
+    if isinstance(part, types.EmbeddedResource):
+        resource = part.resource
+        if isinstance(resource, types.TextResourceContents):
+            return _compact_json(resource.text)
+        return f"[资源: {resource.uri}, {resource.mimeType or '二进制'}]"
+    return str(part)
+
+
+def normalize_result(result: Any) -> str:
+    """把 CallToolResult 转成紧凑的文本
+
+    优先使用内容块中的文本（JSON 文本会被压缩）；没有文本内容时使用
+    structuredContent 的紧凑 JSON。工具报错时加上 "Error: " 前缀。
+    """
+    if isinstance(result, bytes):
+        return result.decode("utf-8", errors="replace")
+    if not isinstance(result, types.CallToolResult):
+        return str(result)
+
+    parts = [_part_text(part) for part in result.content]
+    text = "\n".join(part for part in parts if part)
+    if not text and result.structuredContent is not None:
+        text = json.dumps(result.structuredContent, ensure_ascii=False, separators=(",", ":"))
+    if result.isError:
+        text = f"Error: {text}"
+    return text
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """把文本截断到约 max_tokens 个 token，并注明截断"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens)
+    while keep > 0 and estimate_tokens(text[:keep]) > max_tokens:
+        keep = int(keep * 0.9)
+    return f"{text[:keep]}...(已截断，原文约 {tokens} tokens)"
+
+
+def fit_tokens(text: str, max_tokens: int) -> str:
+    """把文本压缩到约 max_tokens 个 token
+
+    以 "=== 标题 ===" 分段的结果（例如 search_urls）按段分配预算：每段保留标题、
+    缩短正文，不会因为只保留开头而丢掉后面的网页；其他文本截掉末尾。
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    starts = [match.start() for match in _SECTION_RE.finditer(text)]
+    if len(starts) < 2:
+        return truncate_tokens(text, max_tokens)
+
+    head = text[:starts[0]]
+    titles, bodies = [], []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        title, _, body = text[start:end].partition("\n")
+        titles.append(title)
+        bodies.append(body.strip())
+    overhead = estimate_tokens(head) + sum(estimate_tokens(title) + _MARKER_TOKENS for title in titles)
+    counts = [estimate_tokens(body) for body in bodies]
+    shares = share_budget(counts, max_tokens - overhead)
+    sections = [
+        f"{title}\n{truncate_tokens(body, share) if share < count else body}"
+        for title, body, count, share in zip(titles, bodies, counts, shares)
+    ]
+    return head + "\n\n".join(sections) + "\n"
+
+
+def share_budget(demands: list, budget: int) -> list:
+    """把预算（字符或 token）分给多个结果：平均分配，用不完的部分让给较长的结果"""
+    shares = [0] * len(demands)
+    remaining = max(budget, 0)
+    order = sorted(range(len(demands)), key=lambda i: demands[i])
+    for position, i in enumerate(order):
+        shares[i] = min(demands[i], remaining // (len(order) - position))
+        remaining -= shares[i]
+    return shares
@@ -1,15 +1,92 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import unicodedata
+from contextlib import asynccontextmanager
 from typing import Any
-import httpx
 from mcp.server.fastmcp import FastMCP
 from loguru import logger
-import requests
-from bs4 import BeautifulSoup
+
+from tracing import tracer
+
+# 注意：httpx、bs4、web、extract 等较重的依赖在工具首次使用时才导入，
+# 使服务器进程能尽快响应 initialize
+
+# 搜索配置
+SEARCH_ENGINE_URL = os.getenv("SEARCH_ENGINE_URL", "https://www.bing.com/search")
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))  # 搜索请求超时（秒）
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))  # 搜索结果缓存有效期（秒）
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))  # 内存中缓存的查询数
+SEARCH_URL_MAX_CHARS = int(os.getenv("SEARCH_URL_MAX_CHARS", "2000"))  # search_url 返回的最大字符数
+SEARCH_URL_SCAN_CHARS = int(os.getenv("SEARCH_URL_SCAN_CHARS", "20000"))  # 参与相关度排序的正文字符数
+SEARCH_URLS_MAX_URLS = int(os.getenv("SEARCH_URLS_MAX_URLS", "8"))  # search_urls 单次最多读取的网址数
+SEARCH_URLS_MAX_CHARS = int(os.getenv("SEARCH_URLS_MAX_CHARS", "6000"))  # search_urls 所有网页共享的字符预算
+SEARCH_URLS_DEADLINE = float(os.getenv("SEARCH_URLS_DEADLINE", "15"))  # search_urls 的总体截止时间（秒）
+# save_to_file 允许写入的目录；为空时不限制，但网络传输模式下不提供 save_to_file
+SAVE_FILE_DIR = os.getenv("SAVE_FILE_DIR", "")
+
+_search_cache = None
+_prefetcher = None
+# 网络传输模式下多个客户端会话共享 HTTP 连接池、缓存与预取结果，会话结束时不关闭
+_shared_resources = False
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """服务器生命周期：退出时关闭共享的 HTTP 连接池与缓存
+
+    网络传输模式下每个客户端会话都会进入一次 lifespan，共享资源随进程保留。
+    """
+    global _search_cache
+    try:
+        yield {}
+    finally:
+        if not _shared_resources:
+            if _prefetcher is not None:
+                await _prefetcher.aclose()
+            if _search_cache is not None:
+                _search_cache.close()
+                _search_cache = None
+            if "web" in sys.modules:
+                await sys.modules["web"].aclose()
+
 
 # 初始化 FastMCP 服务器
-mcp = FastMCP("tools")
+mcp = FastMCP("tools", lifespan=lifespan)
 logger.debug("FastMCP 服务器启动中...")
 
+
+def _request_meta() -> dict:
+    """当前工具请求的 _meta（客户端在其中传递追踪上下文）"""
+    try:
+        meta = mcp.get_context().request_context.meta
+    except (LookupError, ValueError):
+        return {}
+    return meta.model_dump() if meta is not None else {}
+
+
+def traced(func):
+    """记录工具的服务器端 span，并关联到客户端的工具调用 span"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        meta = _request_meta()
+        with tracer.start_span(
+            "server.tool",
+            tool=func.__name__,
+            trace_id=meta.get("trace_id"),
+            parent_id=meta.get("parent_id"),
+        ) as span:
+            result = await func(*args, **kwargs)
+            span.set(result_bytes=len(str(result).encode("utf-8")))
+            return result
+    return wrapper
+
+
 @mcp.tool()
+@traced
 async def save_to_file(content,output_path) -> str:
     """将输出内容保存到指定文件中。
 
@@ -18,26 +95,80 @@ async def save_to_file(content,output_path) -> str:
         output_path: 要保存到的路径
     """
     try:
+        output_path = _save_path(output_path)
         with open(output_path, 'w') as f:
             f.write(content)
         return f"内容已保存到文件 '{output_path}'"
     except Exception as e:
         return f"保存文件时出现错误: {e}"
 
+def _save_path(output_path: str) -> str:
+    """配置了 SAVE_FILE_DIR 时，把路径限制在该目录内（相对路径以该目录为基准）"""
+    if not SAVE_FILE_DIR:
+        return output_path
+    base = os.path.realpath(SAVE_FILE_DIR)
+    target = os.path.realpath(os.path.join(base, output_path))
+    if os.path.commonpath([base, target]) != base:
+        raise PermissionError(f"只能保存到 {SAVE_FILE_DIR} 目录内")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return target
+
+def _get_search_cache():
+    """返回搜索结果缓存（内存 + 磁盘）"""
+    import web
+    from cache import DiskCache, MemoryCache, TieredCache
+
+    global _search_cache
+    if _search_cache is None:
+        disk = None
+        if web.HTTP_CACHE_DIR:
+            disk = DiskCache(os.path.join(web.HTTP_CACHE_DIR, "search.sqlite3"), 32 * 1024 * 1024)
+        _search_cache = TieredCache(
+            MemoryCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL), disk, SEARCH_CACHE_TTL
+        )
+    return _search_cache
+
+# 规范化查询时去掉的句末标点（全角标点经 NFKC 后多数已转为半角）
+_TRAILING_PUNCTUATION = ".,!?;:。，、！？；："
+
+def _normalize_query(query: str) -> str:
+    """规范化查询用作缓存键：统一全半角与大小写、合并空白、去掉句末标点
+
+    词中的符号保留（"C++ tutorial" 与 "C# tutorial" 是不同的查询）。
+    """
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = " ".join(query.split()).rstrip(_TRAILING_PUNCTUATION + " ")
+    # 键带版本号，旧规则（去掉全部标点）写入磁盘的结果不再命中
+    return f"v2:{query}"
+
 @mcp.tool()
+@traced
 async def search_engine(query:str, ) -> str:
-    """查找和输入内容相关的信息, query越简单概括越好, 网站信息需要进一步调用search_url()函数进行查看
+    """查找和输入内容相关的信息, query越简单概括越好, 网站信息需要进一步调用search_urls()一次读取多个结果, 或用search_url()读取单个网址
 
     参数:
         query: 要搜索的内容
+
+    返回:
+        str: JSON 数组, 每项包含 index、title、url
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    import web
+    from bs4 import BeautifulSoup
+
     num_results=5
+    cache_key = _normalize_query(query)
+    cached = _get_search_cache().get(cache_key)
+    if cached is not None:
+        logger.debug(f"搜索缓存命中: {cache_key}")
+        _prefetch_results(cached)
+        return json.dumps(cached, ensure_ascii=False)
+
     try:
-        url = f"https://www.bing.com/search?q={query}&count={num_results}"
-        response = requests.get(url, headers=headers)
+        response = await web.get(
+            SEARCH_ENGINE_URL,
+            params={"q": query, "count": num_results},
+            timeout=SEARCH_TIMEOUT,
+        )
         soup = BeautifulSoup(response.text, 'html.parser')
         
         # Bing的搜索结果选择器（可能会随Bing更新而变化）
@@ -53,46 +184,86 @@ async def search_engine(query:str, ) -> str:
                 "title": title,
                 "url": link
             })
-            
-        return search_results  # 返回结构化数据
+        
+        # 只缓存非空结果，避免把临时故障缓存下来
+        if search_results:
+            _get_search_cache().set(cache_key, search_results)
+        _prefetch_results(search_results)
+        # 以 JSON 字符串返回结构化结果（与声明的返回类型一致）
+        return json.dumps(search_results, ensure_ascii=False)
         
     except Exception as e:
-        print(f"Bing搜索出错: {e}")
-        return []  # 出错时返回空列表
+        logger.error(f"Bing搜索出错: {e}")
+        return "[]"  # 出错时返回空列表
+
+def _get_prefetcher():
+    """返回搜索结果预取器，未启用（PREFETCH_TOP_K=0）时返回 None"""
+    import prefetch
+
+    global _prefetcher
+    if _prefetcher is None and prefetch.PREFETCH_TOP_K > 0:
+        _prefetcher = prefetch.Prefetcher(lambda url: _fetch_text(url, SEARCH_URL_SCAN_CHARS))
+    return _prefetcher
+
+def _prefetch_results(results: list) -> None:
+    """在模型决定读取哪个结果之前，后台预取排名靠前的搜索结果"""
+    prefetcher = _get_prefetcher()
+    if prefetcher is not None:
+        import prefetch
+        prefetcher.prefetch([result["url"] for result in results[:prefetch.PREFETCH_TOP_K]])
+
+async def _read_text(url: str) -> str:
+    """读取参与相关度排序的网页正文，优先使用预取结果"""
+    prefetcher = _get_prefetcher()
+    if prefetcher is not None:
+        text = await prefetcher.get(url)
+        if text is not None:
+            return text
+    return await _fetch_text(url, SEARCH_URL_SCAN_CHARS)
+
+async def _fetch_text(url: str, limit: int) -> str:
+    """获取网页并提取正文，最多返回 limit 个字符
+
+    使用增量解析器时边下载边提取，文本足够后立即停止下载。
+    """
+    import extract
+    import web
+
+    if extract.resolve_backend() == "stream":
+        extractor = extract.TextExtractor(limit)
+        # 提前结束的正文按提取上限缓存，只供同样上限的读取复用
+        await web.fetch(url, on_chunk=extractor.feed, partial_key=f"text:{limit}")
+        extractor.close()
+        return extractor.text()
+
+    page = await web.fetch(url)
+    return extract.extract_text(page.text, limit)
 
 @mcp.tool()
+@traced
 async def search_url(url: str, query: str) -> str:
-    """对给定url对应的网站的信息进行读取
+    """对给定url对应的网站的信息进行读取, 只返回网页中与query最相关的段落
     
     参数:
         url: 要搜索的网址
+        query: 想从网页中了解的问题, 用于挑选相关段落
         
     返回:
         str: 包含HTML提取内容
     """
+    import httpx
+    import passages
+    import web
+
     try:
-        # 第一部分：获取并分析HTML内容
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+        # 第一部分：获取并分析HTML内容（流式下载，提取到足够文本即停止）
+        text_content = await _read_text(url)
         
-        # 异步获取HTML内容
-        async with httpx.AsyncClient() as client:
-            html_response = await client.get(url, headers=headers, timeout=10.0)
-            html_response.raise_for_status()
-            
-        soup = BeautifulSoup(html_response.text, 'html.parser')
-        
-        # 移除不需要的标签
-        for element in soup(['script', 'style', 'noscript', 'meta', 'link']):
-            element.decompose()
-        
-        # 提取主要文本内容
-        text_content = soup.get_text('\n', strip=True)
-        text_content = '\n'.join([line for line in text_content.split('\n') if line.strip()])
+        # 按与 query 的相关度挑选段落，控制返回长度
+        text_content = passages.top_passages(text_content, query, SEARCH_URL_MAX_CHARS)
         
         html_analysis = (
-            f"HTML文本内容摘要:\n{text_content[:2000]}...\n\n"
+            f"HTML文本内容摘要:\n{text_content}...\n\n"
         )
         
         # 组合两部分结果
@@ -101,6 +272,9 @@ async def search_url(url: str, query: str) -> str:
             f"=== HTML内容 ===\n{html_analysis}\n\n"
         )
         
+    except web.UnsupportedContentType as e:
+        logger.error(f"不支持的内容类型: {e}")
+        return f"无法读取URL: 不支持的内容类型 {str(e)}"
     except httpx.HTTPError as e:
         logger.error(f"HTTP请求失败: {e}")
         return f"无法访问URL: {str(e)}"
@@ -109,6 +283,123 @@ async def search_url(url: str, query: str) -> str:
         return f"搜索时出现错误: {str(e)}"
 
 
+@mcp.tool()
+@traced
+async def search_urls(urls: list[str], query: str) -> str:
+    """同时读取多个网址（例如search_engine返回的多个结果）, 每个网页只返回与query最相关的段落, 比多次调用search_url更快
+
+    参数:
+        urls: 要读取的网址列表
+        query: 想从网页中了解的问题, 用于挑选相关段落
+
+    返回:
+        str: 按网址分段的提取内容, 所有网页共享一个总长度上限
+    """
+    import httpx
+    import passages
+    import web
+    from tool_results import share_budget
+
+    urls = list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+    skipped = urls[SEARCH_URLS_MAX_URLS:]
+    urls = urls[:SEARCH_URLS_MAX_URLS]
+    if not urls:
+        return "没有提供有效的网址"
+
+    # 并发获取（同一主机的并发数与请求速率由 web.fetch 的按主机上限控制），超过截止时间的网页放弃
+    tasks = [asyncio.create_task(_read_text(url)) for url in urls]
+    done, pending = await asyncio.wait(tasks, timeout=SEARCH_URLS_DEADLINE)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    texts, errors = {}, {}
+    for url, task in zip(urls, tasks):
+        if task in pending:
+            errors[url] = f"读取超时（超过 {SEARCH_URLS_DEADLINE:.0f}s）"
+            continue
+        e = task.exception()
+        if e is None:
+            texts[url] = task.result()
+        elif isinstance(e, web.UnsupportedContentType):
+            errors[url] = f"无法读取URL: 不支持的内容类型 {str(e)}"
+        elif isinstance(e, httpx.HTTPError):
+            errors[url] = f"无法访问URL: {str(e)}"
+        else:
+            errors[url] = f"搜索时出现错误: {str(e)}"
+        if url in errors:
+            logger.error(f"读取 {url} 失败: {errors[url]}")
+
+    # 字符预算按网页平均分配，内容较短的网页用不完的部分让给其他网页
+    shares = dict(zip(texts, share_budget([len(text) for text in texts.values()], SEARCH_URLS_MAX_CHARS)))
+    sections = []
+    for index, url in enumerate(urls, 1):
+        if url in texts:
+            if not texts[url].strip():
+                body = "（未提取到文本）"
+            else:
+                body = passages.top_passages(texts[url], query, shares[url]) if shares[url] else ""
+                # 有文本但分不到预算（或预算容不下一个段落）时说明被省略，而不是当作没有文本
+                body = body or f"（已提取 {len(texts[url])} 字，超出总长度上限 {SEARCH_URLS_MAX_CHARS} 字，已省略）"
+        else:
+            body = errors[url]
+        sections.append(f"=== [{index}] {url} ===\n{body}")
+    if skipped:
+        sections.append(f"（超过单次上限 {SEARCH_URLS_MAX_URLS} 个，未读取: {', '.join(skipped)}）")
+
+    return "网页分析结果:\n\n" + "\n\n".join(sections) + "\n"
+
+
+# 只接受本机 Host 头的监听地址（FastMCP 默认开启 DNS 重绑定防护）
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="工具 MCP 服务器")
+    parser.add_argument(
+        "--transport", choices=["stdio", "streamable-http", "sse"], default="stdio",
+        help="stdio: 由客户端作为子进程启动；streamable-http / sse: 作为网络服务供多个客户端共享",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="网络传输模式的监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="网络传输模式的监听端口")
+    parser.add_argument(
+        "--allowed-hosts", default="",
+        help="监听非本机地址时必填：逗号分隔的允许的 Host 头（如 tools.lan:8000,10.0.0.5:*），'*' 表示不检查",
+    )
+    return parser.parse_args()
+
+
+def _transport_security(host: str, allowed_hosts: str):
+    """非本机监听地址的 Host/Origin 校验配置，未给出 --allowed-hosts 时退出"""
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    hosts = [h.strip() for h in allowed_hosts.split(",") if h.strip()]
+    if not hosts:
+        sys.exit(f"监听非本机地址 {host} 时必须用 --allowed-hosts 给出允许的 Host 头（'*' 表示不检查）")
+    if hosts == ["*"]:
+        logger.warning("已关闭 Host 头校验（DNS 重绑定防护），请只在可信网络中这样使用")
+        return None
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=hosts,
+        allowed_origins=[f"{scheme}://{h}" for h in hosts for scheme in ("http", "https")],
+    )
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.transport != "stdio":
+        _shared_resources = True
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+        if args.host not in LOOPBACK_HOSTS:
+            mcp.settings.transport_security = _transport_security(args.host, args.allowed_hosts)
+        if not SAVE_FILE_DIR:
+            # 网络服务没有身份验证，不向远程客户端开放任意路径的文件写入
+            mcp.remove_tool("save_to_file")
+            logger.info("未设置 SAVE_FILE_DIR，网络传输模式下不提供 save_to_file")
+        path = mcp.settings.streamable_http_path if args.transport == "streamable-http" else mcp.settings.sse_path
+        logger.info(f"工具服务器（{args.transport}）监听 http://{args.host}:{args.port}{path}")
+
     # 初始化并运行服务器
-    mcp.run(transport='stdio')
\ No newline at end of file
+    mcp.run(transport=args.transport)
\ No newline at end of file
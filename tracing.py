@@ -0,0 +1,268 @@
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from loguru import logger
+
+# 追踪导出配置（为空表示不导出）
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # span 以 JSON lines 追加写入的文件
+# 每轮结束后覆盖写入的 Prometheus 文本快照，路径中的 {pid} 会替换为进程号
+METRICS_FILE = os.getenv("METRICS_FILE", "").replace("{pid}", str(os.getpid()))
+
+# 耗时直方图的桶边界（秒）
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Span:
+    """一段计时区间，结束时交给 Tracer 导出
+
+    根 span（一轮对话）会汇总其所有子 span 的耗时、token 与字节数，
+    供界面实时展示每轮的耗时分布。
+    """
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        parent: Optional["Span"] = None,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        **attrs,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        # 跨进程传递时（服务器端 span），父级只以 trace_id / parent_id 的形式给出
+        self.trace_id = parent.trace_id if parent is not None else trace_id or uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.attrs = attrs
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None  # 秒，结束后可用
+        self.status = "ok"
+        self.breakdown: dict = {}  # 仅根 span 使用：子 span 名称 -> 汇总
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def child(self, name: str, **attrs) -> "Span":
+        return Span(self.tracer, name, self, **attrs)
+
+    def end(self, status: Optional[str] = None) -> None:
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if status:
+            self.status = status
+        if self.root is not self:
+            self.root._add_child(self)
+        self.tracer._finish(self)
+
+    def _add_child(self, span: "Span") -> None:
+        entry = self.breakdown.setdefault(span.name, {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += span.duration
+        for key in ("prompt_tokens", "completion_tokens", "result_bytes"):
+            if key in span.attrs:
+                entry[key] = entry.get(key, 0) + span.attrs[key]
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.end()
+        elif issubclass(exc_type, (GeneratorExit, KeyboardInterrupt)) or exc_type.__name__ == "CancelledError":
+            self.end("cancelled")
+        else:
+            self.attrs.setdefault("error", f"{exc_type.__name__}: {exc_val}")
+            self.end("error")
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start_time, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "pid": os.getpid(),
+            **self.attrs,
+        }
+
+    def summary(self) -> str:
+        """一轮对话的耗时分布，例如: 本轮 3.21s | 模型 2 次 2.10s (入 1200 / 出 300 tok) | 工具 4 次 1.52s 12.3 KB"""
+        elapsed = self.duration if self.duration is not None else self.elapsed_ms() / 1000
+        parts = [f"本轮 {elapsed:.2f}s"]
+        llm = self.breakdown.get("llm")
+        if llm:
+            text = f"模型 {llm['count']} 次 {llm['seconds']:.2f}s"
+            if "prompt_tokens" in llm or "completion_tokens" in llm:
+                text += f" (入 {llm.get('prompt_tokens', 0)} / 出 {llm.get('completion_tokens', 0)} tok)"
+            parts.append(text)
+        tool = self.breakdown.get("tool")
+        if tool:
+            parts.append(
+                f"工具 {tool['count']} 次 {tool['seconds']:.2f}s {tool.get('result_bytes', 0) / 1024:.1f} KB"
+            )
+        return " | ".join(parts)
+
+
+class Metrics:
+    """最小的 Prometheus 指标注册表：计数器与直方图，可渲染为文本格式"""
+
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._meta: dict = {}  # 指标名 -> (类型, 说明)
+        self._counters: dict = {}  # (指标名, 标签) -> 值
+        self._histograms: dict = {}  # (指标名, 标签) -> [各桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._meta.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._meta.setdefault(name, ("histogram", help))
+            histogram = self._histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = [f'{k}="{str(v)}"' for k, v in labels + extra]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        """渲染为 Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._meta.items()):
+                if help:
+                    lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{self._labels(labels)} {value:g}")
+                    continue
+                for (metric, labels), (counts, total, count) in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        lines.append(f"{name}_bucket{self._labels(labels, (('le', f'{bound:g}'),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{self._labels(labels, (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """创建 span，并在其结束时导出 JSON lines、更新指标、通知监听者"""
+
+    def __init__(self, trace_file: str = TRACE_FILE, metrics_file: str = METRICS_FILE):
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.metrics = Metrics()
+        self._listeners: list = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attrs) -> Span:
+        return Span(self, name, parent, **attrs)
+
+    def context(self, span: Span) -> dict:
+        """span 的传播上下文，随工具调用的 _meta 发送给服务器"""
+        return {"trace_id": span.trace_id, "parent_id": span.span_id}
+
+    def add_listener(self, callback: Callable[[Span], None]) -> None:
+        """注册 span 结束时的回调（例如界面实时刷新耗时分布）"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Span], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _finish(self, span: Span) -> None:
+        self._record_metrics(span)
+        if self.trace_file:
+            self._write_line(span.to_dict())
+        if span.root is span and self.metrics_file:
+            self.write_metrics(self.metrics_file)
+        for callback in list(self._listeners):
+            try:
+                callback(span)
+            except Exception as e:
+                logger.error(f"追踪回调出错: {e}")
+
+    def _record_metrics(self, span: Span) -> None:
+        labels = {"span": span.name}
+        if "tool" in span.attrs:
+            labels["tool"] = span.attrs["tool"]
+        self.metrics.observe("mcp_span_duration_seconds", span.duration, "span 耗时", **labels)
+        if span.status != "ok":
+            self.metrics.inc("mcp_span_errors_total", 1, "未正常结束的 span 数", status=span.status, **labels)
+        for kind in ("prompt", "completion"):
+            if f"{kind}_tokens" in span.attrs:
+                self.metrics.inc("mcp_llm_tokens_total", span.attrs[f"{kind}_tokens"], "对话API用量（token）", type=kind)
+        if "result_bytes" in span.attrs:
+            self.metrics.inc("mcp_tool_result_bytes_total", span.attrs["result_bytes"], "工具结果字节数", **labels)
+
+    def _write_line(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.trace_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.error(f"写入追踪文件失败: {e}")
+
+    def write_metrics(self, path: str) -> None:
+        """原子地写出当前指标快照"""
+        tmp_path = f"{path}.tmp"
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"写入指标快照失败: {e}")
+
+
+def server_env() -> dict:
+    """需要传给 MCP 服务器进程的追踪配置
+
+    服务器端 span 写入同一文件；指标快照写入按进程区分的同目录文件，
+    例如 metrics.prom -> metrics.server-<pid>.prom。
+    """
+    env = {}
+    if TRACE_FILE:
+        env["TRACE_FILE"] = os.path.abspath(TRACE_FILE)
+    if METRICS_FILE:
+        root, ext = os.path.splitext(os.path.abspath(METRICS_FILE))
+        env["METRICS_FILE"] = f"{root}.server-{{pid}}{ext}"
+    return env
+
+
+# 进程内共享的追踪器
+tracer = Tracer()
@@ -0,0 +1,303 @@
+import asyncio
+import codecs
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from loguru import logger
+
+from cache import DiskCache, MemoryCache
+from extract import FEED_CHUNK_SIZE
+from resilience import Resilience
+from scheduling import TokenBucket
+
+# 服务器级 HTTP 配置
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))  # 单次请求超时（秒）
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))  # 连接池总连接数
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "6"))  # 单个主机的并发请求上限
+HTTP_RATE_PER_HOST = float(os.getenv("HTTP_RATE_PER_HOST", "10"))  # 单个主机每秒最多发出的请求数，0 表示不限
+HTTP_RATE_BURST = int(os.getenv("HTTP_RATE_BURST", "10"))  # 单个主机允许的突发请求数
+HTTP_MAX_BYTES = int(os.getenv("HTTP_MAX_BYTES", str(2 * 1024 * 1024)))  # 单个响应最多读取的字节数
+HTTP_MAX_HOSTS = int(os.getenv("HTTP_MAX_HOSTS", "1024"))  # 保留并发限制与熔断状态的主机数（最近使用）
+
+# 持久化响应缓存配置（HTTP_CACHE_DIR 为空时禁用）
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", ".cache")
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+HTTP_CACHE_TTL = float(os.getenv("HTTP_CACHE_TTL", "3600"))  # 无 max-age 时的默认新鲜期（秒）
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# 缓存中保留的响应头
+_CACHED_HEADERS = ("content-type", "etag", "last-modified")
+
+# 允许读取的内容类型前缀（二进制内容直接拒绝，不下载正文）
+TEXT_CONTENT_TYPES = ("text/", "application/xhtml+xml", "application/xml", "application/json")
+
+_client: Optional[httpx.AsyncClient] = None
+_cache: Optional[DiskCache] = None
+# 按主机的并发信号量，只保留最近访问的 HTTP_MAX_HOSTS 个主机，长期运行的共享服务器内存不会随访问过的主机数增长。
+# 被淘汰的主机要在其后又访问过 HTTP_MAX_HOSTS 个其他主机，此时仍在进行的请求最多让该主机短暂超出上限
+_host_limits = MemoryCache(HTTP_MAX_HOSTS)
+_host_rates = MemoryCache(HTTP_MAX_HOSTS)  # 按主机的请求速率令牌桶，同样只保留最近访问的主机
+_resilience = Resilience(max_endpoints=HTTP_MAX_HOSTS)  # 按主机重试、对冲与熔断
+
+cache_stats = {"fresh_hits": 0, "revalidated": 0, "misses": 0}
+
+
+class UnsupportedContentType(Exception):
+    """响应内容不是可提取的文本"""
+
+
+@dataclass
+class FetchResult:
+    """一次网页获取的结果（可能来自缓存）"""
+    url: str
+    status_code: int
+    headers: dict = field(default_factory=dict)
+    content: bytes = b""
+    from_cache: bool = False
+    truncated: bool = False  # 达到 max_bytes 被截断
+    stopped_early: bool = False  # on_chunk 表示内容已足够，提前结束了下载
+
+    @property
+    def encoding(self) -> str:
+        match = re.search(r"charset=([\w-]+)", self.headers.get("content-type", ""), re.I)
+        return match.group(1) if match else "utf-8"
+
+    @property
+    def text(self) -> str:
+        try:
+            return self.content.decode(self.encoding, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+
+def get_client() -> httpx.AsyncClient:
+    """返回服务器共享的异步 HTTP 客户端（长连接池）"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+def get_cache() -> Optional[DiskCache]:
+    """返回持久化响应缓存，未启用时返回 None"""
+    global _cache
+    if _cache is None and HTTP_CACHE_DIR:
+        _cache = DiskCache(os.path.join(HTTP_CACHE_DIR, "http.sqlite3"), HTTP_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    """返回目标主机的并发信号量"""
+    host = urlsplit(url).netloc
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+        _host_limits.set(host, limit)
+    return limit
+
+
+async def _host_rate(url: str) -> None:
+    """按目标主机的请求速率上限等待发送时机（重试与对冲请求同样计数）"""
+    if HTTP_RATE_PER_HOST <= 0:
+        return
+    host = urlsplit(url).netloc
+    bucket = _host_rates.get(host)
+    if bucket is None:
+        bucket = TokenBucket(HTTP_RATE_PER_HOST, HTTP_RATE_BURST)
+        _host_rates.set(host, bucket)
+    await bucket.acquire()
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    """带重试、对冲、熔断与速率限制的 GET 请求（读取完整正文，不经过响应缓存）"""
+    client = get_client()
+
+    async def send() -> httpx.Response:
+        await _host_rate(url)
+        return await client.get(url, **kwargs)
+
+    return await _resilience.send(f"web:{urlsplit(url).netloc}", "web", send)
+
+
+def _freshness(headers: httpx.Headers) -> Optional[float]:
+    """根据 Cache-Control 计算新鲜期，不可缓存时返回 None"""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match:
+        return float(match.group(1))
+    return HTTP_CACHE_TTL
+
+
+def _from_entry(url: str, entry) -> FetchResult:
+    return FetchResult(
+        url=entry.meta.get("url", url),
+        status_code=200,
+        headers=entry.meta.get("headers", {}),
+        content=entry.value,
+        from_cache=True,
+        truncated=entry.meta.get("truncated", False),
+        stopped_early=entry.meta.get("partial", False),
+    )
+
+
+def _decoder(encoding: str):
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def _usable(entry, max_bytes: int) -> bool:
+    """被 max_bytes 截断的缓存只能满足不超过原上限的请求"""
+    return not entry.meta.get("truncated") or max_bytes <= entry.meta.get("max_bytes", 0)
+
+
+def _feed_cached(result: FetchResult, on_chunk: Optional[Callable[[str], bool]]) -> None:
+    """把缓存的正文分段交给 on_chunk，与边下载边提取一样在内容足够时停止"""
+    if on_chunk is None:
+        return
+    text = result.text
+    for start in range(0, len(text), FEED_CHUNK_SIZE):
+        if on_chunk(text[start:start + FEED_CHUNK_SIZE]):
+            break
+
+
+async def _read_body(
+    response: httpx.Response,
+    result: FetchResult,
+    max_bytes: int,
+    on_chunk: Optional[Callable[[str], bool]],
+) -> None:
+    """流式读取响应正文，超过 max_bytes 或 on_chunk 返回 True 时提前停止"""
+    decoder = _decoder(result.encoding)
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes():
+        chunk = chunk[:max_bytes - size]
+        chunks.append(chunk)
+        size += len(chunk)
+        if on_chunk is not None and on_chunk(decoder.decode(chunk)):
+            result.stopped_early = True
+            break
+        if size >= max_bytes:
+            result.truncated = True
+            break
+    result.content = b"".join(chunks)
+
+
+async def fetch(
+    url: str,
+    headers: Optional[dict] = None,
+    max_bytes: int = HTTP_MAX_BYTES,
+    on_chunk: Optional[Callable[[str], bool]] = None,
+    partial_key: str = "",
+) -> FetchResult:
+    """获取网页：新鲜缓存直接返回，过期缓存带 ETag/Last-Modified 条件请求重新验证
+
+    参数:
+        max_bytes: 最多读取的正文字节数，超出部分不再下载
+        on_chunk: 每收到一段解码后的文本即回调，返回 True 表示内容已足够、提前结束下载
+        partial_key: on_chunk 停止条件的标识（例如 "text:20000"）。提前结束的正文不完整，
+            只缓存在 url + partial_key 下，只有停止条件相同的请求才会命中；
+            不给出时不缓存提前结束的正文
+    """
+    cache = get_cache()
+    partial_url = f"{url}#{partial_key}" if partial_key and on_chunk is not None else None
+    entry, cache_key = None, url
+    if cache:
+        entry = cache.get(url)
+        if entry is not None and not _usable(entry, max_bytes):
+            entry = None
+        if entry is None and partial_url:
+            entry, cache_key = cache.get(partial_url), partial_url
+            if entry is not None and not _usable(entry, max_bytes):
+                entry = None
+
+    if entry and entry.age < entry.meta.get("fresh_for", HTTP_CACHE_TTL):
+        cache_stats["fresh_hits"] += 1
+        result = _from_entry(url, entry)
+        _feed_cached(result, on_chunk)
+        return result
+
+    request_headers = dict(headers or {})
+    if entry:
+        cached_headers = entry.meta.get("headers", {})
+        if "etag" in cached_headers:
+            request_headers["If-None-Match"] = cached_headers["etag"]
+        if "last-modified" in cached_headers:
+            request_headers["If-Modified-Since"] = cached_headers["last-modified"]
+
+    async def send() -> httpx.Response:
+        client = get_client()
+        await _host_rate(url)
+        return await client.send(client.build_request("GET", url, headers=request_headers), stream=True)
+
+    async with _host_limit(url):
+        response = await _resilience.send(f"web:{urlsplit(url).netloc}", "web", send)
+        try:
+            if entry and response.status_code == 304:
+                cache_stats["revalidated"] += 1
+                fresh_for = _freshness(response.headers)
+                if fresh_for is not None:
+                    cache.touch(cache_key, {**entry.meta, "fresh_for": fresh_for})
+                result = _from_entry(url, entry)
+                _feed_cached(result, on_chunk)
+                return result
+
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if content_type and not content_type.lower().startswith(TEXT_CONTENT_TYPES):
+                raise UnsupportedContentType(content_type)
+
+            cache_stats["misses"] += 1
+            result = FetchResult(
+                url=str(response.url),
+                status_code=response.status_code,
+                headers={k: v for k, v in response.headers.items() if k in _CACHED_HEADERS},
+            )
+            await _read_body(response, result, max_bytes, on_chunk)
+        finally:
+            await response.aclose()
+
+    fresh_for = _freshness(response.headers)
+    # 提前结束的正文只在调用方给出停止条件标识时，以带标识的键缓存
+    store_key = partial_url if result.stopped_early else url
+    if cache and store_key and response.status_code == 200 and fresh_for is not None:
+        cache.set(store_key, result.content, {
+            "url": result.url,
+            "headers": result.headers,
+            "fresh_for": fresh_for,
+            "truncated": result.truncated,
+            "partial": result.stopped_early,
+            "max_bytes": max_bytes,
+        })
+    logger.debug(f"HTTP 缓存统计: {cache_stats}")
+    return result
+
+
+async def aclose() -> None:
+    """关闭共享的 HTTP 客户端与缓存"""
+    global _client, _cache
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _cache is not None:
+        _cache.close()
+        _cache = None